@@ -0,0 +1,314 @@
+"""
+Benchmarks for the Stonehenge engine.
+
+Times the StonehengeState operations on the search hot path for every
+supported board size, and the per-move latency of every strategy in
+usable_strategies on fixed reference positions. Strategies that stop on a
+time budget are timed doing a fixed amount of work instead. Results are
+written as JSON (seconds per call, by benchmark name) and can be compared
+against a saved baseline, failing when any benchmark got slower than a
+tolerance allows.
+
+The time to first move of a headless process is timed too: a fresh
+interpreter that imports game_interface and makes one move of a strategy.
+
+Usage: python benchmarks.py [--output FILE] [--compare BASELINE]
+"""
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from contextlib import contextmanager, nullcontext
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+from game_interface import usable_strategies
+from stonehenge import StonhengeGame, StonehengeState
+import opening_book
+import proof_search
+import strategy
+
+
+# The board sizes the state operations are timed on: every size a game can
+# be hosted on (1 to server.MAX_SIDES).
+SIDES = list(range(1, 11))
+
+# The reference position every strategy is timed on: the number of sides and
+# the number of plies played into the game. The full-width searches are
+# given positions they solve in well under a second.
+STRATEGY_POSITIONS = {'ro': (5, 4), 'mr': (3, 6), 'mi': (3, 6), 'mu': (3, 4),
+                      'mt': (3, 2), 'ab': (3, 0), 'id': (4, 4), 'mp': (3, 0),
+                      'mc': (4, 4), 'tb': (3, 0), 'ob': (3, 1),
+                      'pn': (3, 0)}
+
+# The fixed work the strategies with a time budget are timed doing, as timing
+# them with their budget would always give the budget: mcts_strategy runs
+# MCTS_ITERATIONS playouts, iterative_deepening searches DEEPENING_DEPTH
+# plies and book_strategy looks its position up in a book built for the
+# benchmark, as deep as the position.
+MCTS_ITERATIONS = 2000
+DEEPENING_DEPTH = 6
+
+# The strategies whose time to first move in a fresh interpreter is timed.
+STARTUP_STRATEGIES = ['ab', 'pn', 'tb']
+
+# The program a startup benchmark runs: one move on a new side-2 board.
+STARTUP_PROGRAM = '''
+from game_interface import playable_games, usable_strategies
+usable_strategies[{!r}](playable_games['h'](True, 2))
+'''
+
+# The number of timed runs of every strategy; the fastest one is reported.
+STRATEGY_REPEAT = 3
+
+# The default fraction by which a benchmark may be slower than its baseline.
+TOLERANCE = 0.25
+
+
+def reference_state(sides: int, plies: int) -> Any:
+    """
+    Return the state plies moves into a game on a board with sides sides,
+    started by p1, picking the moves with a generator seeded by the board
+    size so every run times the same position.
+
+    >>> reference_state(2, 2).get_possible_moves()
+    ['B', 'C', 'D', 'E', 'F']
+    """
+    state = StonehengeState(True, sides)
+    rng = random.Random(sides)
+    for _ in range(plies):
+        moves = state.get_possible_moves()
+        if not moves:
+            break
+        state = state.make_move(rng.choice(moves))
+    return state
+
+
+def time_call(call: Callable[[], Any], repeat: int = 5) -> float:
+    """
+    Return the best time in seconds over repeat runs of one call to call,
+    looping each run often enough to take a measurable time.
+    """
+    timer = timeit.Timer(call)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number
+
+
+def state_benchmarks(sides: int) -> Dict[str, float]:
+    """
+    Return the seconds per call of the StonehengeState operations on a
+    board with sides sides, a few plies into a game.
+    """
+    state = reference_state(sides, sides // 2)
+    move = state.get_possible_moves()[0]
+    prefix = 'state/{}/'.format(sides)
+    return {prefix + '__init__': time_call(lambda: StonehengeState(True,
+                                                                   sides)),
+            prefix + 'make_move': time_call(lambda: state.make_move(move)),
+            prefix + 'get_possible_moves':
+                time_call(state.get_possible_moves),
+            prefix + 'over': time_call(state.over),
+            prefix + 'rough_outcome': time_call(state.rough_outcome),
+            prefix + '__str__': time_call(state.__str__)}
+
+
+def reset_strategy_caches() -> None:
+    """
+    Forget everything the strategies kept from earlier moves, so every timed
+    move is searched from scratch.
+    """
+    strategy.MINIMAX_TABLE.clear()
+    strategy.MCTS_TREE.clear()
+    proof_search.PROOF_TABLE.clear()
+
+
+def timed_strategy(key: str) -> Callable[[Any], Any]:
+    """
+    Return the function strategy_benchmark times for the strategy key from
+    usable_strategies: the strategy itself, or the same search doing a fixed
+    amount of work for a strategy with a time budget.
+    """
+    if key == 'mc':
+        return lambda game: strategy.mcts_strategy(
+            game, iterations=MCTS_ITERATIONS)
+    if key == 'id':
+        return lambda game: strategy.iterative_deepening(
+            game, float('inf'), DEEPENING_DEPTH)
+    if key == 'ob':
+        return lambda game: opening_book.book_strategy(game, out_of_book)
+    return usable_strategies[key]
+
+
+def out_of_book(game: Any) -> Any:
+    """
+    Raise ValueError: the fallback of book_strategy in its benchmark, whose
+    position must be in the book.
+    """
+    raise ValueError("the position of {} is not in the book".format(game))
+
+
+def first_move(game: Any) -> Any:
+    """
+    Return the first possible move of game, the move every position of the
+    benchmark book is given.
+    """
+    return game.current_state.get_possible_moves()[0]
+
+
+@contextmanager
+def benchmark_book(sides: int, depth: int) -> Iterator[None]:
+    """
+    Make book_strategy use a book of every position up to depth plies into a
+    game on a board with sides sides, built in a temporary directory, until
+    the with block ends.
+    """
+    book_dir = opening_book.BOOK_DIR
+    with tempfile.TemporaryDirectory() as directory:
+        opening_book.BOOK_DIR = directory
+        try:
+            opening_book.build_book(sides, depth, first_move)
+            yield
+        finally:
+            opening_book.BOOK_DIR = book_dir
+            opening_book.unload_book(sides)
+
+
+def strategy_benchmark(key: str, sides: int, plies: int,
+                       repeat: int = STRATEGY_REPEAT) -> float:
+    """
+    Return the best time in seconds over repeat moves of the strategy key
+    from usable_strategies, as timed_strategy gives it, on its reference
+    position.
+
+    One untimed move is made first, so pools, tables and books that are set
+    up on first use are not counted.
+    """
+    game = StonhengeGame(True, sides)
+    state = reference_state(sides, plies)
+    choose_move = timed_strategy(key)
+    best = float('inf')
+    with benchmark_book(sides, plies) if key == 'ob' else nullcontext():
+        for run in range(repeat + 1):
+            reset_strategy_caches()
+            game.current_state = state
+            start = time.perf_counter()
+            choose_move(game)
+            if run > 0:
+                best = min(best, time.perf_counter() - start)
+    return best
+
+
+def startup_benchmark(key: Optional[str],
+                      repeat: int = STRATEGY_REPEAT) -> float:
+    """
+    Return the best time in seconds over repeat runs of a fresh interpreter
+    that imports game_interface and makes one move of the strategy key from
+    usable_strategies, or only imports game_interface if key is None.
+    """
+    program = STARTUP_PROGRAM.format(key) if key is not None else \
+        'import game_interface'
+    command = [sys.executable, '-c', program]
+    directory = os.path.dirname(os.path.abspath(__file__))
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=directory, check=True)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run_benchmarks(sides: List[int], strategies: List[str],
+                   repeat: int = STRATEGY_REPEAT,
+                   startup: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Return the results of the state benchmarks for every size in sides, the
+    strategy benchmarks for every key in strategies and the startup
+    benchmarks for every key in startup (STARTUP_STRATEGIES by default).
+    """
+    if startup is None:
+        startup = STARTUP_STRATEGIES
+    results = {}
+    for size in sides:
+        results.update(state_benchmarks(size))
+    for key in strategies:
+        size, plies = STRATEGY_POSITIONS[key]
+        results['strategy/{}/{}'.format(key, size)] = \
+            strategy_benchmark(key, size, plies, repeat)
+    if startup:
+        results['startup/import'] = startup_benchmark(None, repeat)
+    for key in startup:
+        results['startup/{}'.format(key)] = startup_benchmark(key, repeat)
+    return {'python': platform.python_version(),
+            'machine': platform.machine(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'results': results}
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any],
+            tolerance: float = TOLERANCE) -> List[str]:
+    """
+    Return the names of the benchmarks in current that are more than
+    tolerance slower than in baseline, printing every benchmark they share.
+
+    >>> compare({'results': {'a': 1.0, 'b': 2.6}},
+    ...         {'results': {'a': 1.0, 'b': 2.0}})  # doctest: +ELLIPSIS
+    benchmark ...
+    a ...
+    b ... 1.30x  SLOWER
+    ['b']
+    """
+    slower = []
+    print('{:<36} {:>12} {:>12} {:>7}'.format('benchmark', 'baseline',
+                                              'current', 'ratio'))
+    for name, seconds in current['results'].items():
+        if name not in baseline['results']:
+            continue
+        ratio = seconds / baseline['results'][name]
+        flag = ''
+        if ratio > 1 + tolerance:
+            slower.append(name)
+            flag = '  SLOWER'
+        print('{:<36} {:>12.3e} {:>12.3e} {:>6.2f}x{}'.format(
+            name, baseline['results'][name], seconds, ratio, flag))
+    return slower
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Run the benchmarks from the command line arguments argv and return the
+    exit status: 1 if a comparison found a regression, 0 otherwise.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sides', type=int, nargs='*', default=SIDES)
+    parser.add_argument('--strategies', nargs='*',
+                        default=sorted(STRATEGY_POSITIONS))
+    parser.add_argument('--startup', nargs='*', default=STARTUP_STRATEGIES,
+                        help="strategies to time the first move of in a "
+                             "fresh interpreter")
+    parser.add_argument('--repeat', type=int, default=STRATEGY_REPEAT)
+    parser.add_argument('--output', default=None,
+                        help="file to write the results to")
+    parser.add_argument('--compare', default=None,
+                        help="baseline results file to compare against")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    args = parser.parse_args(argv)
+    current = run_benchmarks(args.sides, args.strategies, args.repeat,
+                             args.startup)
+    if args.output is not None:
+        with open(args.output, 'w') as output:
+            json.dump(current, output, indent=1)
+    if args.compare is None:
+        json.dump(current, sys.stdout, indent=1)
+        print()
+        return 0
+    with open(args.compare) as baseline_file:
+        baseline = json.load(baseline_file)
+    return 1 if compare(current, baseline, args.tolerance) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
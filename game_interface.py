@@ -9,24 +9,120 @@ strategy cannot be used on Chopsticks unless you account for infinite loops.
 your own curiousity!)
 """
 # TODO: import the modules needed to make game_interface run.
-from strategy import interactive_strategy, rough_outcome_strategy, \
-    recursive_minimax, iterative_minimax
-from typing import Any, Callable
-from subtract_square_game import SubtractSquareGame
-from stonehenge import StonhengeGame
+from typing import Any, Callable, Dict, Iterator, Optional
+from collections.abc import Mapping
+import importlib
+import importlib.util
+import sys
+import time
+
+
+class LazyRegistry(Mapping):
+    """
+    A mapping from keys to games or strategies, each given as the string
+    'module:name' and imported only when it is first looked up, so that only
+    the engines actually selected are ever loaded.
+
+    A key whose module does not exist maps to None, like a game or strategy
+    that is not implemented. Errors raised while importing a module that
+    does exist are passed on.
+
+    specs - the 'module:name' of each key
+    """
+    specs: Dict[str, str]
+
+    def __init__(self, specs: Dict[str, str]) -> None:
+        """
+        Initialize a registry of the games or strategies in specs, without
+        importing any of them.
+
+        >>> registry = LazyRegistry({'d': 'json:dumps', 'x': 'no_such:thing'})
+        >>> 'd' in registry, 'x' in registry, registry.name('d')
+        (True, True, 'dumps')
+        >>> registry['d']([1])
+        '[1]'
+        >>> registry['x'] is None, registry.available('x')
+        (True, False)
+        """
+        self.specs = dict(specs)
+        self._loaded = {}
+
+    def __getitem__(self, key: str) -> Any:
+        """
+        Return the game or strategy of key, importing its module if needed,
+        or None if the module does not exist.
+        """
+        if key not in self._loaded:
+            module_name, name = self.specs[key].split(':')
+            try:
+                module = importlib.import_module(module_name)
+            except ModuleNotFoundError as error:
+                if error.name != module_name and \
+                        not module_name.startswith(error.name + '.'):
+                    raise
+                self._loaded[key] = None
+            else:
+                self._loaded[key] = getattr(module, name)
+        return self._loaded[key]
+
+    def __contains__(self, key: Any) -> bool:
+        """
+        Return whether key is registered, without importing anything.
+        """
+        return key in self.specs
+
+    def __iter__(self) -> Iterator[str]:
+        """
+        Return an iterator over the keys, without importing anything.
+        """
+        return iter(self.specs)
+
+    def __len__(self) -> int:
+        """
+        Return the number of keys.
+        """
+        return len(self.specs)
+
+    def name(self, key: str) -> str:
+        """
+        Return the name of the game or strategy of key, without importing it.
+        """
+        return self.specs[key].split(':')[1]
+
+    def available(self, key: str) -> bool:
+        """
+        Return whether the module of key can be found, importing it only if
+        it was looked up already.
+        """
+        if key in self._loaded:
+            return self._loaded[key] is not None
+        module_name = self.specs[key].split(':')[0]
+        return importlib.util.find_spec(module_name) is not None
+
 
 # TODO: Replace None with the corresponding class name for your games.
 # 'h' should map to Stonehenge.
-playable_games = {'s': SubtractSquareGame,
-                  'h': StonhengeGame}
+playable_games = LazyRegistry({'s': 'subtract_square_game:SubtractSquareGame',
+                               'h': 'stonehenge:StonhengeGame',
+                               'hb': 'stonehenge_bitboard:'
+                                     'BitboardStonhengeGame'})
 
 # TODO: Replace None with the corresponding function names for your strategies.
 # 'mr' should map to your recursive implementation of minimax while
 # 'mi' should map to your iterative implementation of minimax
-usable_strategies = {'i': interactive_strategy,
-                     'ro': rough_outcome_strategy,
-                     'mr': recursive_minimax,
-                     'mi': iterative_minimax}
+usable_strategies = LazyRegistry({'i': 'strategy:interactive_strategy',
+                                  'ro': 'strategy:rough_outcome_strategy',
+                                  'mr': 'strategy:recursive_minimax',
+                                  'mi': 'strategy:iterative_minimax',
+                                  'mu': 'strategy:inplace_minimax',
+                                  'mt': 'strategy:transposition_minimax',
+                                  'ab': 'strategy:alphabeta_minimax',
+                                  'id': 'strategy:iterative_deepening',
+                                  'mp': 'strategy:parallel_minimax',
+                                  'mc': 'strategy:mcts_strategy',
+                                  'tb': 'tablebase:tablebase_strategy',
+                                  'ob': 'opening_book:book_strategy',
+                                  'pn': 'proof_search:proof_number_strategy'})
 
 
 class GameInterface:
@@ -36,11 +132,15 @@ class GameInterface:
     """
 
     def __init__(self, game: Any, p1_strategy: Callable,
-                 p2_strategy: Callable[[Any], Any]) -> None:
+                 p2_strategy: Callable[[Any], Any],
+                 show_stats: bool = False,
+                 record_path: Optional[str] = None) -> None:
         """
         Initialize this GameInterface, setting its active game to game, and
         using the strategies p1_strategy for Player 1 and p2_strategy for
-        Player 2.
+        Player 2. If show_stats, the search statistics of every move are
+        printed after it. If record_path is given, the finished game of
+        Stonehenge is appended to the game log there.
 
         :param game: The game to be played.
         :type game:
@@ -48,6 +148,10 @@ class GameInterface:
         :type p1_strategy:
         :param p2_strategy: The strategy for Play 2.
         :type p2_strategy:
+        :param show_stats: Whether to print search statistics.
+        :type show_stats: bool
+        :param record_path: The game log to append the game to.
+        :type record_path: str
         """
         first_player = input("Type y if player 1 is to make the first move: ")
         is_p1_turn = False
@@ -57,12 +161,24 @@ class GameInterface:
         self.game = game(is_p1_turn)
         self.p1_strategy = p1_strategy
         self.p2_strategy = p2_strategy
+        self.show_stats = show_stats
+        if show_stats:
+            from strategy import SEARCH_STATS
+            SEARCH_STATS.enabled = True
+        self.record_path = record_path
 
     def play(self) -> None:
         """
         Play the game.
         """
         current_state = self.game.current_state
+        record = None
+        if self.record_path is not None and hasattr(current_state, 'sides'):
+            from game_record import GameRecord
+            record = GameRecord(current_state.sides, current_state.p1_turn)
+        stats = None
+        if self.show_stats:
+            from strategy import SEARCH_STATS as stats
 
         print(self.game.get_instructions())
         print(current_state)
@@ -78,12 +194,19 @@ class GameInterface:
                 print(move)
 
             # Pick a (legal) move.
+            if stats is not None:
+                stats.reset(None)
+            start = time.perf_counter()
             while not current_state.is_valid_move(move_to_make):
                 current_strategy = self.p2_strategy
                 if current_state.get_current_player_name() == 'p1':
                     current_strategy = self.p1_strategy
                 move_to_make = current_strategy(self.game)
 
+            if record is not None:
+                record.add_move(move_to_make,
+                                seconds=time.perf_counter() - start)
+
             # Apply the move
             current_player_name = current_state.get_current_player_name()
             new_game_state = current_state.make_move(move_to_make)
@@ -92,8 +215,15 @@ class GameInterface:
 
             print("{} made the move {}. The game's state is now:".format(
                 current_player_name, move_to_make))
+            if stats is not None and stats.strategy is not None:
+                print(stats)
             print(current_state)
 
+        if record is not None:
+            from game_record import GameRecordWriter
+            with GameRecordWriter(self.record_path) as writer:
+                writer.write(record)
+
         # Print out the winner of the game
         if self.game.is_winner("p1"):
             print("Player 1 is the winner!")
@@ -104,15 +234,13 @@ class GameInterface:
 
 
 if __name__ == '__main__':
-    games = ", ".join(["'{}': {}".format(key, playable_games[key].__name__) if
-                       playable_games[key] is not None else
-                       "'{}': None".format(key) for key in playable_games])
+    games = ", ".join(["'{}': {}".format(
+        key, playable_games.name(key) if playable_games.available(key)
+        else None) for key in playable_games])
 
-    strategies = ", ".join(["'{}': {}".format(key,
-                                              usable_strategies[key].__name__)
-                            if usable_strategies[key] is not None else
-                            "'{}': None".format(key)
-                            for key in usable_strategies])
+    strategies = ", ".join(["'{}': {}".format(
+        key, usable_strategies.name(key) if usable_strategies.available(key)
+        else None) for key in usable_strategies])
 
     chosen_game = ''
     while chosen_game not in playable_games.keys():
@@ -128,5 +256,9 @@ if __name__ == '__main__':
     while p2 not in usable_strategies.keys():
         p2 = input("Select the strategy for Player 2 ({}): ".format(strategies))
 
+    record_to = None
+    if '--record' in sys.argv[1:-1]:
+        record_to = sys.argv[sys.argv.index('--record') + 1]
     GameInterface(playable_games[chosen_game], usable_strategies[p1],
-                  usable_strategies[p2]).play()
+                  usable_strategies[p2], '--stats' in sys.argv[1:],
+                  record_to).play()
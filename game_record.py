@@ -0,0 +1,231 @@
+"""
+A compact, append-only log of played games of Stonehenge.
+
+A log file starts with a header, then holds one record per game, appended as
+games finish. A record is a fixed header (the number of sides, flags saying
+who started and which optional lists follow, and the number of moves), the
+moves as one byte each (the cell index in board order), then optionally a
+float32 evaluation and a float32 number of seconds for every move.
+
+Records are read back one at a time, so logs of any size can be streamed.
+"""
+from typing import Any, BinaryIO, Iterator, List, Optional
+from array import array
+import os
+import struct
+import sys
+from stonehenge import StonehengeState, board_layout
+
+
+MAGIC = b'STGR'
+VERSION = 1
+FILE_HEADER = struct.Struct('<4sB')
+RECORD_HEADER = struct.Struct('<BBH')
+
+# The bits of a record's flags.
+P1_STARTS, HAS_EVALS, HAS_SECONDS = 1, 2, 4
+
+
+class GameRecord:
+    """
+    The record of one played game.
+
+    sides - the number of sides of the board
+    p1_starts - whether p1 made the first move
+    moves - the moves made, in order
+    evals - an evaluation of every move by the player who made it, or None
+    seconds - the seconds every move took to pick, or None
+    """
+    sides: int
+    p1_starts: bool
+    moves: List[str]
+    evals: Optional[List[float]]
+    seconds: Optional[List[float]]
+
+    def __init__(self, sides: int, p1_starts: bool,
+                 moves: Optional[List[str]] = None,
+                 evals: Optional[List[float]] = None,
+                 seconds: Optional[List[float]] = None) -> None:
+        """
+        Initialize the record of a game on a board with sides sides, started
+        by p1 if p1_starts.
+        """
+        self.sides = sides
+        self.p1_starts = p1_starts
+        self.moves = moves if moves is not None else []
+        self.evals = evals
+        self.seconds = seconds
+
+    def add_move(self, move: str, evaluation: Optional[float] = None,
+                 seconds: Optional[float] = None) -> None:
+        """
+        Add move to the end of this record, with its evaluation and the
+        seconds it took if they are known.
+        """
+        self.moves.append(move)
+        if evaluation is not None:
+            if self.evals is None:
+                self.evals = [0.0] * (len(self.moves) - 1)
+            self.evals.append(evaluation)
+        elif self.evals is not None:
+            self.evals.append(0.0)
+        if seconds is not None:
+            if self.seconds is None:
+                self.seconds = [0.0] * (len(self.moves) - 1)
+            self.seconds.append(seconds)
+        elif self.seconds is not None:
+            self.seconds.append(0.0)
+
+    def to_bytes(self) -> bytes:
+        """
+        Return this record in the log format.
+
+        >>> record = GameRecord(2, True, ['A', 'G'], seconds=[0.5, 0.25])
+        >>> data = record.to_bytes()
+        >>> len(data)
+        14
+        >>> import io
+        >>> copy = next(read_stream(io.BytesIO(data)))
+        >>> copy.moves, copy.evals, copy.seconds
+        (['A', 'G'], None, [0.5, 0.25])
+        """
+        letters = board_layout(self.sides).letters
+        if len(letters) > 256:
+            raise ValueError("boards with more than 256 cells cannot be "
+                             "recorded")
+        flags = P1_STARTS if self.p1_starts else 0
+        if self.evals is not None:
+            flags |= HAS_EVALS
+        if self.seconds is not None:
+            flags |= HAS_SECONDS
+        index = {letter: i for i, letter in enumerate(letters)}
+        data = RECORD_HEADER.pack(self.sides, flags, len(self.moves)) + \
+            bytes(index[move] for move in self.moves)
+        if self.evals is not None:
+            data += array('f', self.evals).tobytes()
+        if self.seconds is not None:
+            data += array('f', self.seconds).tobytes()
+        return data
+
+    def replay(self) -> Iterator[StonehengeState]:
+        """
+        Yield the state at the start of this game and after each of its
+        moves, made with StonehengeState.make_move.
+
+        >>> record = GameRecord(2, True, ['A', 'G'])
+        >>> [len(state.get_possible_moves()) for state in record.replay()]
+        [7, 6, 5]
+        """
+        state = StonehengeState(self.p1_starts, self.sides)
+        yield state
+        for move in self.moves:
+            state = state.make_move(move)
+            yield state
+
+
+class GameRecordWriter:
+    """
+    Appends GameRecords to a log file.
+
+    path - the path of the log file
+    """
+    path: str
+
+    def __init__(self, path: str) -> None:
+        """
+        Open the log file at path for appending, creating it with a header
+        if it does not exist or is empty.
+        """
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._file = open(path, 'ab')
+        if self._file.tell() == 0:
+            self._file.write(FILE_HEADER.pack(MAGIC, VERSION))
+            self._file.flush()
+
+    def write(self, record: GameRecord) -> None:
+        """
+        Append record to the log, flushing it so a crash loses at most the
+        game being played.
+        """
+        self._file.write(record.to_bytes())
+        self._file.flush()
+
+    def close(self) -> None:
+        """
+        Close the log file.
+        """
+        self._file.close()
+
+    def __enter__(self) -> 'GameRecordWriter':
+        """
+        Return this writer, for use in a with statement.
+        """
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        """
+        Close the log file at the end of a with statement.
+        """
+        self.close()
+
+
+def read_records(path: str) -> Iterator[GameRecord]:
+    """
+    Yield the GameRecords in the log file at path one at a time, in the
+    order they were written.
+    """
+    with open(path, 'rb') as log_file:
+        header = log_file.read(FILE_HEADER.size)
+        if len(header) < FILE_HEADER.size:
+            return
+        magic, version = FILE_HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("{} is not a Stonehenge game log".format(path))
+        yield from read_stream(log_file)
+
+
+def read_stream(stream: BinaryIO) -> Iterator[GameRecord]:
+    """
+    Yield the GameRecords in stream, a binary stream positioned after the
+    file header, until it ends.
+    """
+    while True:
+        header = stream.read(RECORD_HEADER.size)
+        if not header:
+            return
+        if len(header) < RECORD_HEADER.size:
+            raise ValueError("truncated game record")
+        sides, flags, count = RECORD_HEADER.unpack(header)
+        cells = stream.read(count)
+        if len(cells) < count:
+            raise ValueError("truncated game record")
+        letters = board_layout(sides).letters
+        record = GameRecord(sides, bool(flags & P1_STARTS),
+                            [letters[cell] for cell in cells])
+        for flag, name in ((HAS_EVALS, 'evals'), (HAS_SECONDS, 'seconds')):
+            if flags & flag:
+                values = array('f')
+                data = stream.read(values.itemsize * count)
+                if len(data) < values.itemsize * count:
+                    raise ValueError("truncated game record")
+                values.frombytes(data)
+                setattr(record, name, values.tolist())
+        yield record
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("usage: python game_record.py LOG")
+        sys.exit(2)
+    for number, game_record in enumerate(read_records(sys.argv[1]), 1):
+        final = None
+        for final in game_record.replay():
+            pass
+        result = 'unfinished'
+        if final.over():
+            result = '{} won'.format('p2' if final.p1_turn else 'p1')
+        print("game {}: sides {}, {} moves, {}: {}".format(
+            number, game_record.sides, len(game_record.moves), result,
+            ' '.join(game_record.moves)))
@@ -14,7 +14,12 @@ class GameState:
     LOSE - score if player is in a losing position
     DRAW - score if player is in a tied position
     p1_turn - whether it is p1's turn or not
+
+    States are created by the thousand during a search, so they keep their
+    attributes in __slots__ rather than a __dict__; subclasses that declare
+    __slots__ of their own stay that way.
     """
+    __slots__ = ('p1_turn',)
     WIN: int = 1
     LOSE: int = -1
     DRAW: int = 0
@@ -0,0 +1,221 @@
+"""
+Opening books for Stonehenge.
+
+A book maps every position within the first few plies of a game to the move a
+deep offline search chose there. Positions are keyed from the point of view
+of the player to move, so games started by p1 and by p2 share entries, and
+after moving them by the board symmetry that makes the smallest key, so
+equivalent positions share one entry too. The moves are stored in that moved
+frame and mapped back when they are looked up.
+
+File layout: a header, then the records sorted by key. Each record is the
+key (key_bytes bytes, little-endian) followed by one byte, the cell index of
+the move.
+"""
+from typing import Any, Callable, Dict, Optional, Tuple
+import os
+import struct
+import sys
+from stonehenge import StonhengeGame
+from stonehenge_bitboard import BitboardStonehengeState, get_layout
+from strategy import iterative_deepening
+from symmetry import get_symmetries, transformed
+
+
+# The directory the book files are kept in.
+BOOK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'books')
+
+# The default number of seconds the builder searches every book position.
+BOOK_TIME_BUDGET = 10.0
+
+MAGIC = b'STOB'
+VERSION = 2
+HEADER = struct.Struct('<4sBBBI')
+
+# The loaded books, by number of sides. None if a size has no book file.
+_BOOKS: Dict[int, Optional[Dict[int, int]]] = {}
+
+
+def book_path(sides: int) -> str:
+    """
+    Return the path of the book file for a board with sides sides.
+    """
+    return os.path.join(BOOK_DIR, 'stonehenge{}.book'.format(sides))
+
+
+def key_bytes(sides: int) -> int:
+    """
+    Return the number of bytes in a book key for a board with sides sides.
+    """
+    layout = get_layout(sides)
+    return (2 * len(layout.letters) + 2 * len(layout.line_masks) + 7) // 8
+
+
+def position_key(state: Any) -> int:
+    """
+    Return the book key of state.
+
+    >>> from stonehenge import StonehengeState
+    >>> position_key(StonehengeState(True, 2).make_move('A')) == \\
+    ...     position_key(StonehengeState(False, 2).make_move('A'))
+    True
+    >>> position_key(StonehengeState(True, 2).make_move('A')) == \\
+    ...     position_key(StonehengeState(True, 2).make_move('G'))
+    True
+    """
+    return canonical_position(state)[0]
+
+
+def canonical_position(state: Any) -> Tuple[int, int]:
+    """
+    Return the book key of state and the index of the board symmetry it was
+    moved by to make it.
+
+    The key packs the cells and leylines of the player to move, then those
+    of the other player, into one integer, and is the smallest such integer
+    over every symmetry of the board.
+    """
+    state = BitboardStonehengeState.from_state(state)
+    layout = state.layout
+    cells, lines = len(layout.letters), len(layout.line_masks)
+    best = best_symmetry = None
+    for symmetry in range(len(get_symmetries(state.sides).cell_perms)):
+        p1_cells, p2_cells, p1_lines, p2_lines = transformed(state, symmetry)
+        if state.p1_turn:
+            mine, theirs, my_lines, their_lines = \
+                p1_cells, p2_cells, p1_lines, p2_lines
+        else:
+            mine, theirs, my_lines, their_lines = \
+                p2_cells, p1_cells, p2_lines, p1_lines
+        key = mine | theirs << cells | my_lines << 2 * cells | \
+            their_lines << 2 * cells + lines
+        if best is None or key < best:
+            best, best_symmetry = key, symmetry
+    return best, best_symmetry
+
+
+def build_book(sides: int, depth: int,
+               search: Optional[Callable[[Any], Any]] = None,
+               path: Optional[str] = None) -> str:
+    """
+    Search every position up to depth plies into a game on a board with sides
+    sides, write the chosen moves to path (book_path(sides) by default) and
+    return the path.
+
+    search is the strategy used for every position; by default it is
+    iterative_deepening with BOOK_TIME_BUDGET seconds per position.
+    """
+    if search is None:
+        def search(game: Any) -> Any:
+            """
+            Return the move iterative_deepening picks for game within
+            BOOK_TIME_BUDGET seconds.
+            """
+            return iterative_deepening(game, BOOK_TIME_BUDGET)
+    path = path or book_path(sides)
+    game = StonhengeGame(True, sides)
+    book = {}
+    _add_positions(BitboardStonehengeState(True, sides), depth, game, search,
+                   book)
+    width = key_bytes(sides)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'wb') as book_file:
+        book_file.write(HEADER.pack(MAGIC, VERSION, sides, width, len(book)))
+        for key in sorted(book):
+            book_file.write(key.to_bytes(width, 'little'))
+            book_file.write(bytes([book[key]]))
+    unload_book(sides)
+    return path
+
+
+def _add_positions(state: Any, depth: int, game: Any,
+                   search: Callable[[Any], Any], book: Dict[int, int]) -> None:
+    """
+    Add the move search picks at state, and at every position up to depth
+    plies below it, to book, as the cell index of the move moved by the same
+    symmetry as the key.
+    """
+    key, symmetry = canonical_position(state)
+    if key in book or state.over():
+        return
+    game.current_state = BitboardStonehengeState.from_state(state)
+    cell = state.layout.index[search(game)]
+    book[key] = get_symmetries(state.sides).cell_perms[symmetry][cell]
+    if depth == 0:
+        return
+    for move in state.get_possible_moves():
+        state.apply_move(move)
+        _add_positions(state, depth - 1, game, search, book)
+        state.undo_move()
+
+
+def load_book(sides: int) -> Optional[Dict[int, int]]:
+    """
+    Return the book for a board with sides sides as a dictionary from key to
+    move cell index, or None if there is no book file. Each book is read once.
+    """
+    if sides not in _BOOKS:
+        path = book_path(sides)
+        if not os.path.exists(path):
+            _BOOKS[sides] = None
+            return None
+        with open(path, 'rb') as book_file:
+            data = book_file.read()
+        magic, version, _, width, count = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError("{} is not a Stonehenge book".format(path))
+        if version != VERSION:
+            raise ValueError("{} is an old book, rebuild it".format(path))
+        book = {}
+        for start in range(HEADER.size, HEADER.size + count * (width + 1),
+                           width + 1):
+            book[int.from_bytes(data[start:start + width], 'little')] = \
+                data[start + width]
+        _BOOKS[sides] = book
+    return _BOOKS[sides]
+
+
+def unload_book(sides: int) -> None:
+    """
+    Forget the loaded book for a board with sides sides, so its file is read
+    again the next time it is needed.
+    """
+    _BOOKS.pop(sides, None)
+
+
+def book_move(state: Any) -> Optional[str]:
+    """
+    Return the book move for state, or None if state is out of book.
+    """
+    book = load_book(state.sides)
+    if book is None:
+        return None
+    key, symmetry = canonical_position(state)
+    cell = book.get(key)
+    if cell is None:
+        return None
+    symmetries = get_symmetries(state.sides)
+    cell = symmetries.cell_perms[symmetries.inverses[symmetry]][cell]
+    return get_layout(state.sides).letters[cell]
+
+
+def book_strategy(game: Any,
+                  fallback: Callable[[Any], Any] = iterative_deepening) \
+        -> Any:
+    """
+    Return a move for game from the opening book for its board size, or from
+    fallback if the current state is out of book.
+    """
+    move = book_move(game.current_state)
+    if move is not None:
+        return move
+    return fallback(game)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("usage: python opening_book.py SIDES DEPTH [SECONDS]")
+        sys.exit(2)
+    if len(sys.argv) > 3:
+        BOOK_TIME_BUDGET = float(sys.argv[3])
+    print(build_book(int(sys.argv[1]), int(sys.argv[2])))
@@ -0,0 +1,238 @@
+"""
+A depth-first proof-number (df-pn) solver for Stonehenge.
+
+Every position is either a win or a loss for the player to move, so instead
+of scoring the whole tree, the solver keeps two numbers per position: phi,
+how many more positions must be solved to prove the player to move wins, and
+delta, how many to prove they lose. It always works on the position that is
+cheapest to settle, which finds short proofs in large trees quickly.
+
+The numbers live in a bounded TranspositionTable that is kept between moves,
+so the work done for one move is reused for the next.
+"""
+from typing import Any, List, Optional, Tuple
+from search_stats import SearchStats
+from stonehenge_bitboard import BitboardStonehengeState
+from strategy import SYMMETRY_DEPTH, active_stats, collect_stats
+from symmetry import distinct_moves
+from transposition import TranspositionTable
+
+
+# A proof or disproof number too large to ever be reached.
+INFINITY = 1 << 30
+
+# How far past the second best child the best one may be searched before the
+# search comes back to compare them, as a fraction of the second best's
+# number (the 1 + epsilon trick). Larger values switch between children less.
+EPSILON = 0.25
+
+# The default number of positions proof_number_strategy may expand per move.
+NODE_BUDGET = 200000
+
+# The megabytes the shared table of proof and disproof numbers may use.
+PROOF_TABLE_MEGABYTES = 64
+
+# The table shared by proof_number_strategy across moves and games.
+PROOF_TABLE = TranspositionTable.with_memory(PROOF_TABLE_MEGABYTES)
+
+# The result of proof_number_strategy's last search: 'proven' is 'win' or
+# 'loss' for the player who was to move, or 'unknown', and 'move' the move
+# it returned.
+LAST_PROOF = {}
+
+
+class ProofNumberSearch:
+    """
+    One df-pn search, over a bitboard state changed in place.
+
+    table - the proof and disproof numbers of the positions seen so far, by
+            Zobrist hash
+    node_budget - the number of positions the search may expand
+    nodes - the number of positions expanded so far
+    stats - the statistics collector to fill in, or None
+    """
+    table: TranspositionTable
+    node_budget: int
+    nodes: int
+    stats: Optional[SearchStats]
+
+    def __init__(self, table: TranspositionTable, node_budget: int,
+                 stats: Optional[SearchStats] = None) -> None:
+        """
+        Initialize a search storing its numbers in table, expanding at most
+        node_budget positions.
+        """
+        self.table = table
+        self.node_budget = node_budget
+        self.nodes = 0
+        self.stats = stats
+
+    def solve(self, state: Any) -> Tuple[Optional[int], Any]:
+        """
+        Return the value of state for the player to move (WIN, LOSE, or None
+        if the budget ran out first) and the move to make.
+
+        A proven win returns a winning move. Otherwise the move is the one
+        closest to being proven a win, or the first move if the position is
+        proven lost.
+        """
+        moves = self.moves(state, 0)
+        if not moves:
+            return state.LOSE, None
+        phi, delta = self.expand(state, INFINITY, INFINITY, 0)
+        if delta == 0:
+            return state.LOSE, moves[0]
+        children = []
+        for move in moves:
+            state.apply_move(move)
+            won = state.over()
+            children.append(self.guess(state) if not won else (INFINITY, 0))
+            state.undo_move()
+            if won:
+                return state.WIN, move
+        order = sorted(range(len(moves)), key=lambda i: children[i][1])
+        if phi == 0:
+            # The proof of a child may have been pushed out of the table, so
+            # search the children until one is proven lost again.
+            for i in order:
+                state.apply_move(moves[i])
+                _, child_delta = self.expand(state, INFINITY, INFINITY, 1)
+                state.undo_move()
+                if child_delta == 0:
+                    return state.WIN, moves[i]
+        return None, moves[order[0]]
+
+    @staticmethod
+    def moves(state: Any, ply: int) -> List[Any]:
+        """
+        Return the moves to search from state, ply plies below the root.
+        Within SYMMETRY_DEPTH plies of the root, a move symmetric to an
+        earlier one is left out.
+        """
+        moves = state.get_possible_moves()
+        if ply < SYMMETRY_DEPTH:
+            return distinct_moves(state, moves)
+        return moves
+
+    def guess(self, state: Any) -> Tuple[int, int]:
+        """
+        Return the stored (phi, delta) of state, which is not over, or a first
+        guess at them if it was not searched yet: the number of leylines
+        each player still needs to claim to win.
+        """
+        entry = self.table.lookup(state.zobrist)
+        if self.stats is not None:
+            self.stats.cache(entry is not None)
+        if entry is not None:
+            return entry
+        needed = state.layout.win_needed
+        if state.p1_turn:
+            mine, theirs = state.p1_lines, state.p2_lines
+        else:
+            mine, theirs = state.p2_lines, state.p1_lines
+        return needed - mine.bit_count(), needed - theirs.bit_count()
+
+    def expand(self, state: Any, phi_threshold: int, delta_threshold: int,
+               ply: int) -> Tuple[int, int]:
+        """
+        Search state, ply plies below the root, until its phi reaches
+        phi_threshold, its delta reaches delta_threshold or the budget runs
+        out, store its (phi, delta) and return them.
+
+        phi is the smallest delta of a child and delta the sum of the phis of
+        the children. The child with the smallest delta is searched with
+        thresholds that return to this position once another child would
+        become the one to search. The numbers of the children are kept here
+        while state is searched, so the search goes on even when the table
+        is too full to hold them.
+        """
+        self.nodes += 1
+        start_nodes = self.nodes
+        moves = self.moves(state, ply)
+        children = []
+        won = False
+        for move in moves:
+            state.apply_move(move)
+            won = state.over()
+            if not won:
+                children.append(self.guess(state))
+            state.undo_move()
+            if won:
+                break
+        if self.stats is not None:
+            self.stats.visit(ply, won)
+        if won:
+            self.table.store(state.zobrist, (0, INFINITY), INFINITY)
+            return 0, INFINITY
+        while True:
+            phi, delta = INFINITY, 0
+            best, best_phi, second = 0, 1, INFINITY
+            for i, (child_phi, child_delta) in enumerate(children):
+                if child_delta < phi:
+                    second = phi
+                    phi, best, best_phi = child_delta, i, child_phi
+                elif child_delta < second:
+                    second = child_delta
+                delta = min(delta + child_phi, INFINITY)
+            if phi >= phi_threshold or delta >= delta_threshold or \
+                    self.nodes >= self.node_budget:
+                break
+            state.apply_move(moves[best])
+            children[best] = self.expand(
+                state, min(delta_threshold + best_phi - delta, INFINITY),
+                min(phi_threshold, int(second * (1 + EPSILON)) + 1), ply + 1)
+            state.undo_move()
+        proven = phi == 0 or delta == 0
+        self.table.store(state.zobrist, (phi, delta),
+                         INFINITY if proven else self.nodes - start_nodes)
+        return phi, delta
+
+
+def solve(state: Any, node_budget: int = NODE_BUDGET,
+          table: TranspositionTable = PROOF_TABLE) \
+        -> Tuple[Optional[int], Any]:
+    """
+    Return the value of state for the player to move (WIN, LOSE, or None if
+    node_budget positions were not enough to tell) and the move to make,
+    keeping the numbers found in table.
+
+    >>> from stonehenge import StonehengeState
+    >>> solve(StonehengeState(True, 2), table=TranspositionTable(1000))
+    (1, 'D')
+    >>> solve(StonehengeState(True, 4), 100, TranspositionTable(1000))[0]
+    """
+    search = ProofNumberSearch(table, node_budget, active_stats())
+    return search.solve(BitboardStonehengeState.from_state(state))
+
+
+@collect_stats
+def proof_number_strategy(game: Any, node_budget: int = NODE_BUDGET,
+                          table: TranspositionTable = PROOF_TABLE) -> Any:
+    """
+    Return a move for game through df-pn search of at most node_budget
+    positions, reusing the numbers in table from earlier moves.
+
+    Whether the position was proven a win or a loss for the player to move,
+    or neither, is left in LAST_PROOF, and in SEARCH_STATS.info['proven']
+    while statistics are collected.
+
+    >>> from stonehenge import StonhengeGame
+    >>> proof_number_strategy(StonhengeGame(True, 2), 1000,
+    ...                       TranspositionTable(1000))
+    'D'
+    >>> LAST_PROOF['proven']
+    'win'
+    """
+    state = game.current_state
+    value, move = solve(state, node_budget, table)
+    proven = {state.WIN: 'win', state.LOSE: 'loss'}.get(value, 'unknown')
+    LAST_PROOF.update(proven=proven, move=move)
+    stats = active_stats()
+    if stats is not None:
+        stats.info['proven'] = proven
+    return move
+
+
+if __name__ == "__main__":
+    from python_ta import check_all
+    check_all(config="a2_pyta.txt")
@@ -0,0 +1,198 @@
+"""
+Statistics about a game tree search.
+
+A SearchStats is filled in by the strategies while they search, but only
+when it is enabled: a disabled collector is never handed to the search
+helpers, so they pay one comparison per node for it.
+"""
+from typing import Any, Dict, List, Optional
+import time
+
+
+class SearchStats:
+    """
+    Counts of what one search for a move did.
+
+    enabled - whether the strategies fill in this collector
+    strategy - the name of the strategy that made the last search
+    nodes_at_depth - the number of positions searched at each depth below
+                     the root (index 0 is the root)
+    terminals - the number of positions searched where the game was over
+    cache_hits - the number of positions found in a cache instead of searched
+    cache_misses - the number of positions looked up in a cache and searched
+    depth_seconds - for searches that deepen one ply at a time, the seconds
+                    each finished depth took
+    seconds - the seconds the last search took
+    info - other numbers particular to a strategy
+    """
+    enabled: bool
+    strategy: Optional[str]
+    nodes_at_depth: List[int]
+    terminals: int
+    cache_hits: int
+    cache_misses: int
+    depth_seconds: List[float]
+    seconds: float
+    info: Dict[str, Any]
+
+    def __init__(self, enabled: bool = False) -> None:
+        """
+        Initialize an empty SearchStats, filled in by the strategies if
+        enabled.
+
+        >>> stats = SearchStats(True)
+        >>> stats.reset('example')
+        >>> for depth in [0, 1, 1, 2, 2, 2, 2]:
+        ...     stats.visit(depth, depth == 2)
+        >>> stats.nodes, stats.max_depth, stats.terminals
+        (7, 2, 4)
+        >>> stats.branching_factor
+        2.0
+        """
+        self.enabled = enabled
+        self.strategy = None
+        self._start = 0.0
+        self.reset(None)
+
+    def reset(self, strategy: Optional[str]) -> None:
+        """
+        Forget the last search and start timing a new one by strategy.
+        """
+        self.strategy = strategy
+        self.nodes_at_depth = [0]
+        self.terminals = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.depth_seconds = []
+        self.seconds = 0.0
+        self.info = {}
+        self._start = time.perf_counter()
+
+    def finish(self) -> None:
+        """
+        Stop timing the current search.
+        """
+        self.seconds = time.perf_counter() - self._start
+
+    def visit(self, depth: int, terminal: bool = False) -> None:
+        """
+        Count a position searched depth plies below the root, where the game
+        is over if terminal.
+        """
+        nodes_at_depth = self.nodes_at_depth
+        while len(nodes_at_depth) <= depth:
+            nodes_at_depth.append(0)
+        nodes_at_depth[depth] += 1
+        if terminal:
+            self.terminals += 1
+
+    def cache(self, hit: bool) -> None:
+        """
+        Count one cache lookup, which found the position if hit.
+        """
+        if hit:
+            self.cache_hits += 1
+        else:
+            self.cache_misses += 1
+
+    def depth_finished(self) -> None:
+        """
+        Record that the search finished one more depth at this moment.
+        """
+        self.depth_seconds.append(time.perf_counter() - self._start -
+                                  sum(self.depth_seconds))
+
+    @property
+    def nodes(self) -> int:
+        """
+        Return the number of positions searched.
+        """
+        return sum(self.nodes_at_depth)
+
+    @property
+    def max_depth(self) -> int:
+        """
+        Return the deepest depth below the root a position was searched at.
+        """
+        return len(self.nodes_at_depth) - 1
+
+    @property
+    def nodes_per_second(self) -> float:
+        """
+        Return the number of positions searched per second.
+        """
+        return self.nodes / self.seconds if self.seconds > 0 else 0.0
+
+    @property
+    def branching_factor(self) -> float:
+        """
+        Return the effective branching factor: the number of children every
+        position would need for a uniform tree of max_depth to hold as many
+        positions beyond the root as were searched.
+        """
+        if self.max_depth == 0:
+            return 0.0
+        # Solve b + b**2 + ... + b**d = nodes - 1 for b by bisection.
+        target = self.nodes - 1
+        low, high = 0.0, float(max(target, 1))
+        for _ in range(60):
+            middle = (low + high) / 2
+            if sum(middle ** d for d in range(1, self.max_depth + 1)) < target:
+                low = middle
+            else:
+                high = middle
+        return round(high, 6)
+
+    @property
+    def cache_hit_rate(self) -> Optional[float]:
+        """
+        Return the fraction of cache lookups that found the position, or None
+        if there was no cache.
+        """
+        lookups = self.cache_hits + self.cache_misses
+        return self.cache_hits / lookups if lookups else None
+
+    def as_dict(self) -> Dict[str, Any]:
+        """
+        Return the statistics of the last search as a dictionary.
+        """
+        return {'strategy': self.strategy, 'nodes': self.nodes,
+                'seconds': self.seconds,
+                'nodes_per_second': self.nodes_per_second,
+                'max_depth': self.max_depth, 'terminals': self.terminals,
+                'branching_factor': self.branching_factor,
+                'nodes_at_depth': list(self.nodes_at_depth),
+                'depth_seconds': list(self.depth_seconds),
+                'cache_hits': self.cache_hits,
+                'cache_misses': self.cache_misses,
+                'cache_hit_rate': self.cache_hit_rate, **self.info}
+
+    def __str__(self) -> str:
+        """
+        Return a one-paragraph summary of the last search.
+
+        >>> stats = SearchStats(True)
+        >>> stats.reset('example')
+        >>> stats.visit(0)
+        >>> print(stats)  # doctest: +ELLIPSIS
+        example: 1 nodes in ... s (... nodes/s), max depth 0, 0 terminal, ...
+        """
+        text = "{}: {} nodes in {:.3f} s ({:.0f} nodes/s), max depth {}, " \
+               "{} terminal, branching factor {:.2f}".format(
+                   self.strategy, self.nodes, self.seconds,
+                   self.nodes_per_second, self.max_depth, self.terminals,
+                   self.branching_factor)
+        if self.cache_hit_rate is not None:
+            text += ", cache hit rate {:.1%}".format(self.cache_hit_rate)
+        if self.depth_seconds:
+            text += "\n  seconds per depth: " + ", ".join(
+                "{}: {:.3f}".format(depth + 1, seconds)
+                for depth, seconds in enumerate(self.depth_seconds))
+        for name, value in self.info.items():
+            text += "\n  {}: {}".format(name, value)
+        return text
+
+
+if __name__ == "__main__":
+    from python_ta import check_all
+    check_all(config="a2_pyta.txt")
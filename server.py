@@ -0,0 +1,374 @@
+"""
+An asyncio server hosting many games of Stonehenge at once.
+
+Clients talk to the server over TCP, one JSON object per line. Every request
+gets one reply line; clients watching a game are also sent an event line
+after every move made in it.
+
+Requests:
+    {"op": "new", "sides": 3, "p1": "human", "p2": "ab", "p1_starts": true}
+        start a game on a board of at most MAX_SIDES sides; each player is
+        "human" or a key of usable_strategies. The client is made a watcher
+        of the new game.
+    {"op": "move", "game": 1, "player": "p1", "move": "A"}
+        make a move for a human player whose turn it is
+    {"op": "state", "game": 1}
+        get the state of a game
+    {"op": "watch", "game": 1}
+        be sent the state of a game after every move
+    {"op": "list"}
+        get the ids of the games
+
+Strategy moves are worked out in a bounded pool of worker processes, so a
+long search never holds up the event loop or any other game. If a strategy
+fails, its player is handed over to the clients, who can go on with "move".
+A finished game is removed FINISHED_SECONDS after its last move.
+
+Usage: python server.py [--host HOST] [--port PORT] [--workers N]
+"""
+from typing import Any, Dict, List, Optional, Set
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import asyncio
+import json
+import multiprocessing
+from game_interface import usable_strategies
+from stonehenge import StonhengeGame, StonehengeState
+
+
+# The player kind of a player whose moves are sent in by a client.
+HUMAN = 'human'
+
+# The default number of processes working out strategy moves.
+WORKERS = 2
+
+# The seconds a finished game is kept for clients to look at.
+FINISHED_SECONDS = 600
+
+# The most sides a client may ask for; larger boards take long enough to
+# lay out that they would hold up every other game.
+MAX_SIDES = 10
+
+
+def field(request: Dict[str, Any], name: str, kind: type,
+          default: Any = None) -> Any:
+    """
+    Return the value of name in request, or default if it is missing and
+    default is not None. Raise KeyError if a field without a default is
+    missing, and TypeError if the value is not of type kind.
+
+    >>> field({'game': 1}, 'game', int)
+    1
+    >>> field({}, 'sides', int, 3)
+    3
+    >>> field({'move': 5}, 'move', str)
+    Traceback (most recent call last):
+    ...
+    TypeError: 'move' must be of type str, not 5
+    """
+    if name not in request and default is not None:
+        return default
+    value = request[name]
+    if not isinstance(value, kind) or \
+            (kind is int and isinstance(value, bool)):
+        raise TypeError("{!r} must be of type {}, not {!r}".format(
+            name, kind.__name__, value))
+    return value
+
+
+def choose_move(strategy: str, encoded: bytes) -> Any:
+    """
+    Return the move the strategy named strategy in usable_strategies picks
+    for the state encoded by to_bytes as encoded. Run in a worker process.
+    """
+    state = StonehengeState.from_bytes(encoded)
+    game = StonhengeGame(state.p1_turn, state.sides)
+    game.current_state = state
+    return usable_strategies[strategy](game)
+
+
+class GameSession:
+    """
+    One game hosted by a GameServer.
+
+    game_id - the id clients use for this game
+    game - the game being played
+    players - the kind of each player, HUMAN or a strategy key, by name
+    moves - the moves made so far
+    watchers - the streams of the clients watching this game
+    """
+    game_id: int
+    game: StonhengeGame
+    players: Dict[str, str]
+    moves: List[str]
+    watchers: Set[asyncio.StreamWriter]
+
+    def __init__(self, game_id: int, sides: int, p1: str, p2: str,
+                 p1_starts: bool) -> None:
+        """
+        Initialize a new game with game_id on a board with sides sides
+        between players of kinds p1 and p2.
+        """
+        self.game_id = game_id
+        self.game = StonhengeGame(p1_starts, sides)
+        self.players = {'p1': p1, 'p2': p2}
+        self.moves = []
+        self.watchers = set()
+
+    def to_move(self) -> Optional[str]:
+        """
+        Return the name of the player to move, or None if the game is over.
+        """
+        state = self.game.current_state
+        if self.game.is_over(state):
+            return None
+        return state.get_current_player_name()
+
+    def describe(self) -> Dict[str, Any]:
+        """
+        Return the state of this game as a dictionary for a client.
+        """
+        state = self.game.current_state
+        winner = None
+        if self.game.is_winner('p1'):
+            winner = 'p1'
+        elif self.game.is_winner('p2'):
+            winner = 'p2'
+        return {'game': self.game_id, 'players': self.players,
+                'moves': self.moves, 'to_move': self.to_move(),
+                'winner': winner,
+                'possible_moves': state.get_possible_moves(),
+                'encoded': state.to_bytes().hex(), 'board': str(state)}
+
+
+class GameServer:
+    """
+    A server hosting many GameSessions, with strategy moves worked out in a
+    pool of worker processes.
+
+    sessions - the hosted games, by id
+    finished_seconds - the seconds a finished game is kept before it is
+                       removed from sessions
+    """
+    sessions: Dict[int, GameSession]
+    finished_seconds: float
+
+    def __init__(self, workers: int = WORKERS,
+                 finished_seconds: float = FINISHED_SECONDS) -> None:
+        """
+        Initialize a server with no games, working out strategy moves in
+        workers processes.
+        """
+        self.sessions = {}
+        self.finished_seconds = finished_seconds
+        # Workers are spawned, not forked, so they do not hold on to the
+        # sockets of the clients connected when they start.
+        self._pool = ProcessPoolExecutor(
+            workers, mp_context=multiprocessing.get_context('spawn'))
+        self._next_id = 1
+        self._tasks = set()
+
+    def close(self) -> None:
+        """
+        Stop the worker processes.
+        """
+        self._pool.shutdown(cancel_futures=True)
+
+    async def handle_client(self, reader: asyncio.StreamReader,
+                            writer: asyncio.StreamWriter) -> None:
+        """
+        Answer the requests of one client until it disconnects or sends a
+        line too long to read.
+        """
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    await send(writer, {'ok': False,
+                                        'error': "request line too long"})
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                try:
+                    reply = self.handle_request(json.loads(line), writer)
+                except (ValueError, KeyError, TypeError) as error:
+                    reply = {'ok': False, 'error': str(error)}
+                await send(writer, reply)
+        except ConnectionError:
+            pass
+        finally:
+            for session in self.sessions.values():
+                session.watchers.discard(writer)
+            writer.close()
+
+    def handle_request(self, request: Dict[str, Any],
+                       writer: asyncio.StreamWriter) -> Dict[str, Any]:
+        """
+        Carry out request from the client writing to writer and return the
+        reply. Raise ValueError, KeyError or TypeError on a bad request.
+        """
+        if not isinstance(request, dict):
+            raise TypeError("a request must be a JSON object")
+        op = field(request, 'op', str)
+        if op == 'list':
+            return {'ok': True, 'games': sorted(self.sessions)}
+        if op == 'new':
+            session = self.new_game(field(request, 'sides', int, 3),
+                                    field(request, 'p1', str, HUMAN),
+                                    field(request, 'p2', str, HUMAN),
+                                    field(request, 'p1_starts', bool, True))
+            session.watchers.add(writer)
+            return {'ok': True, **session.describe()}
+        if op not in ('state', 'watch', 'move'):
+            raise ValueError("unknown op {!r}".format(op))
+        game_id = field(request, 'game', int)
+        session = self.sessions.get(game_id)
+        if session is None:
+            raise ValueError("no game {!r}".format(game_id))
+        if op == 'state':
+            return {'ok': True, **session.describe()}
+        if op == 'watch':
+            session.watchers.add(writer)
+            return {'ok': True, **session.describe()}
+        self.human_move(session, field(request, 'player', str),
+                        field(request, 'move', str))
+        return {'ok': True, **session.describe()}
+
+    def new_game(self, sides: int, p1: str, p2: str,
+                 p1_starts: bool) -> GameSession:
+        """
+        Start a game on a board with sides sides between players of kinds p1
+        and p2, and return it.
+        """
+        for kind in (p1, p2):
+            if kind != HUMAN and (kind not in usable_strategies or
+                                  kind == 'i'):
+                raise ValueError("unknown player {!r}".format(kind))
+        if not 1 <= sides <= MAX_SIDES:
+            raise ValueError("a board needs 1 to {} sides".format(MAX_SIDES))
+        session = GameSession(self._next_id, sides, p1, p2, p1_starts)
+        self.sessions[session.game_id] = session
+        self._next_id += 1
+        self._start_strategy_turns(session)
+        return session
+
+    def human_move(self, session: GameSession, player: str,
+                   move: str) -> None:
+        """
+        Make move in session for the human player, and start any strategy
+        moves that follow it.
+        """
+        if session.players.get(player) != HUMAN:
+            raise ValueError("{!r} is not a human player".format(player))
+        if session.to_move() != player:
+            raise ValueError("it is not {}'s turn".format(player))
+        move = session.game.str_to_move(move)
+        if not session.game.current_state.is_valid_move(move):
+            raise ValueError("{!r} is not a valid move".format(move))
+        self._make_move(session, move)
+        self._start_strategy_turns(session)
+
+    def _make_move(self, session: GameSession, move: str) -> None:
+        """
+        Make move in session and tell its watchers.
+        """
+        game = session.game
+        game.current_state = game.current_state.make_move(move)
+        session.moves.append(move)
+        event = {'event': 'move', **session.describe()}
+        for watcher in list(session.watchers):
+            self._spawn(send(watcher, event))
+        if session.to_move() is None:
+            asyncio.get_running_loop().call_later(
+                self.finished_seconds, self.sessions.pop, session.game_id,
+                None)
+
+    def _start_strategy_turns(self, session: GameSession) -> None:
+        """
+        Start playing the strategy moves of session in the background.
+        """
+        player = session.to_move()
+        if player is not None and session.players[player] != HUMAN:
+            self._spawn(self._play_strategy_turns(session))
+
+    async def _play_strategy_turns(self, session: GameSession) -> None:
+        """
+        Play the moves of session while a strategy is to move, working each
+        one out in the process pool. If a strategy fails, its player is
+        made HUMAN so clients can finish the game.
+        """
+        loop = asyncio.get_running_loop()
+        player = session.to_move()
+        while player is not None and session.players[player] != HUMAN:
+            try:
+                move = await loop.run_in_executor(
+                    self._pool, choose_move, session.players[player],
+                    session.game.current_state.to_bytes())
+            except Exception as error:
+                event = {'event': 'error', 'game': session.game_id,
+                         'error': "{} failed: {!r}; {} is now human".format(
+                             session.players[player], error, player)}
+                session.players[player] = HUMAN
+                for watcher in list(session.watchers):
+                    await send(watcher, event)
+                return
+            self._make_move(session, move)
+            player = session.to_move()
+
+    def _spawn(self, coroutine: Any) -> None:
+        """
+        Run coroutine as a background task, keeping a reference to it until
+        it is done.
+        """
+        task = asyncio.ensure_future(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+
+async def send(writer: asyncio.StreamWriter, message: Dict[str, Any]) -> None:
+    """
+    Send message to the client writing to writer as one line of JSON,
+    ignoring clients that have gone away.
+    """
+    if writer.is_closing():
+        return
+    writer.write(json.dumps(message).encode() + b'\n')
+    try:
+        await writer.drain()
+    except ConnectionError:
+        pass
+
+
+async def serve(host: str, port: int, workers: int) -> None:
+    """
+    Run a GameServer on host and port until cancelled.
+    """
+    game_server = GameServer(workers)
+    server = await asyncio.start_server(game_server.handle_client, host, port)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        game_server.close()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """
+    Run the server with the command line arguments argv.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=WORKERS)
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -2,8 +2,9 @@
 An implementation of Stonehenge.
 
 """
-from typing import Any
-import copy
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from operator import itemgetter
+import random
 from game_state import GameState
 from game import Game
 
@@ -13,17 +14,242 @@ from game import Game
 "them in stonehenge.py."
 
 
+class BoardLayout:
+    """
+    The fixed geometry of a Stonehenge board with a given number of sides,
+    generated once per size and shared by every state of that size. States
+    hold only who owns each cell and leyline; everything else is here.
+
+    sides - the number of sides of the board
+    letters - the cell labels, row by row from the top (board order)
+    index - maps each cell label to its position in board order
+    leylines - the cell labels of every leyline, by direction
+    line_names - the (direction, line index) of every leyline, ordered by
+                 direction; a state's lines follow this order
+    line_cells - the cells (in board order) of every leyline
+    line_owners - for every leyline, a function from a state's cells to the
+                  owners of the leyline's cells, as a sequence
+    cell_lines - the leylines every cell lies on
+    cell_bits - the bit of every cell in a state's empty mask
+    template - the format string __str__ fills in to draw the board
+    fields - for every field of template, the (direction, line index,
+             position) in current_hedge it shows; line index -1 is the
+             leyline markers
+    sources - for every field of template, the cell it shows, or ~line for
+              the marker of a leyline
+    move_order - the cell labels in the order moves are listed in (sorted)
+    move_bits - maps each cell label to its bit in a state's empty mask,
+                its position in move_order
+    cell_keys, line_keys - the Zobrist keys of every cell and leyline, for
+                           p1 and p2
+    turn_key - the Zobrist key for p1 to move
+    board_key - the Zobrist key every state of this board starts from
+    """
+    sides: int
+    letters: List[str]
+    index: Dict[str, int]
+    leylines: Dict[str, List[List[str]]]
+    line_names: List[Tuple[str, int]]
+    line_cells: List[Tuple[int, ...]]
+    line_owners: List[Callable[[bytearray], Any]]
+    cell_lines: List[Tuple[int, ...]]
+    cell_bits: List[int]
+    template: str
+    fields: List[Tuple[str, int, int]]
+    sources: List[int]
+    move_order: List[str]
+    move_bits: Dict[str, int]
+    cell_keys: Tuple[List[int], List[int]]
+    line_keys: Tuple[List[int], List[int]]
+    turn_key: int
+    board_key: int
+
+    def __init__(self, sides: int) -> None:
+        """
+        Generate the layout of a board with sides sides.
+
+        The board has rows of 2 up to sides + 1 cells, then a last row of
+        sides cells whose columns start at 1. The cell in row and column
+        lies on '-' leyline row, '/' leyline column and '\\' leyline
+        column - row + sides - 1.
+
+        >>> BoardLayout(2).leylines['/']
+        [['A', 'C'], ['B', 'D', 'F'], ['E', 'G']]
+        >>> BoardLayout(2).line_cells[3], BoardLayout(2).cell_lines[3]
+        ((0, 2), (1, 4, 7))
+        """
+        if sides < 1:
+            raise ValueError("a board needs at least one side")
+        self.sides = sides
+        rows = [list(range(row + 2)) for row in range(sides)] + \
+            [list(range(1, sides + 1))]
+        self.letters = []
+        coordinates = []
+        for row, columns in enumerate(rows):
+            for column in columns:
+                self.letters.append(cell_label(len(self.letters)))
+                coordinates.append((row, column))
+        self.index = {letter: i for i, letter in enumerate(self.letters)}
+        self.leylines = {'-': [[] for _ in range(sides + 1)],
+                         '/': [[] for _ in range(sides + 1)],
+                         '\\': [[] for _ in range(sides + 1)]}
+        for letter, (row, column) in zip(self.letters, coordinates):
+            self.leylines['-'][row].append(letter)
+            self.leylines['/'][column].append(letter)
+            self.leylines['\\'][column - row + sides - 1].append(letter)
+        self.line_names = [(leys, line) for leys in self.leylines
+                           for line in range(len(self.leylines[leys]))]
+        self.line_cells = [tuple(self.index[letter]
+                                 for letter in self.leylines[leys][line])
+                           for leys, line in self.line_names]
+        self.line_owners = [itemgetter(*cells) if len(cells) > 1 else
+                            itemgetter(slice(cells[0], cells[0] + 1))
+                            for cells in self.line_cells]
+        self.cell_lines = [tuple(line for line, cells in
+                                 enumerate(self.line_cells) if cell in cells)
+                           for cell in range(len(self.letters))]
+        self.template, self.fields = self._build_template(rows)
+        lines = {name: line for line, name in enumerate(self.line_names)}
+        self.sources = [~lines[(leys, pos)] if line == -1 else
+                        self.index[self.leylines[leys][line][pos]]
+                        for leys, line, pos in self.fields]
+        self.move_order = sorted(self.letters)
+        self.move_bits = {letter: bit
+                          for bit, letter in enumerate(self.move_order)}
+        self.cell_bits = [1 << self.move_bits[letter]
+                          for letter in self.letters]
+        # The Zobrist keys come from a generator seeded by sides, so they are
+        # the same in every process: the turn key, then for every cell in
+        # move order its keys and those of its leylines not drawn yet, then
+        # the board key.
+        generator = random.Random(sides)
+        self.turn_key = generator.getrandbits(64)
+        cell_keys = ([0] * len(self.letters), [0] * len(self.letters))
+        line_keys = ([None] * len(self.line_names),
+                     [None] * len(self.line_names))
+        for letter in self.move_order:
+            cell = self.index[letter]
+            for keys in cell_keys:
+                keys[cell] = generator.getrandbits(64)
+            for line in self.cell_lines[cell]:
+                if line_keys[0][line] is None:
+                    for keys in line_keys:
+                        keys[line] = generator.getrandbits(64)
+        self.cell_keys, self.line_keys = cell_keys, line_keys
+        self.board_key = generator.getrandbits(64)
+
+    def _build_template(self, rows: List[List[int]]) \
+            -> Tuple[str, List[Tuple[str, int, int]]]:
+        """
+        Return the format string that draws this board and the hedge entry
+        shown by each of its fields.
+        """
+        sides = self.sides
+        width = max(len(letter) for letter in self.letters)
+        step = width + 3 + (width + 3) % 2
+        half = step // 2
+        lines = [{} for _ in range(2 * sides + 5)]
+        positions = {}
+        for row, columns in enumerate(rows):
+            start = half * (sides - 1 - row) if row < sides else half
+            text = lines[2 * row + 2]
+            text[start] = ('-', -1, row)
+            for i, column in enumerate(columns):
+                x = start + step * (i + 1)
+                text[x - step + width + (step - width - 1) // 2] = '-'
+                text[x] = ('-', row, i)
+                positions[(row, column)] = x
+            end = start + step * (len(columns) + 1)
+            if row < sides - 1:
+                text[end] = ('/', -1, row + 2)
+                lines[2 * row + 3][end - 1] = '/'
+            elif row == sides:
+                text[end] = ('\\', -1, sides)
+        for column in range(2):
+            x = positions[(0, column)]
+            lines[0][x + half] = ('/', -1, column)
+            lines[1][x + width] = '/'
+        for (row, column), x in positions.items():
+            if row < sides - 1 or (row == sides - 1 and column > 0):
+                lines[2 * row + 3][x - 1] = '/'
+            lines[2 * row + 3][x + width] = '\\'
+            if row == sides:
+                lines[2 * row + 4][x + half] = ('\\', -1, column - 1)
+        field = '{:<' + str(width) + '}' if width > 1 else '{}'
+        template = ''
+        fields = []
+        for text in lines:
+            column = 0
+            for x in sorted(text):
+                template += ' ' * (x - column)
+                if isinstance(text[x], tuple):
+                    fields.append(text[x])
+                    template += field
+                    column = x + width
+                else:
+                    template += text[x]
+                    column = x + 1
+            template += '\n'
+        return template, fields
+
+
+# What a hedge shows for a cell or leyline owned by nobody (for a leyline),
+# p1 and p2.
+MARKS = '@12'
+
+# The generated board layouts, by number of sides.
+_BOARD_LAYOUTS: Dict[int, BoardLayout] = {}
+
+
+def cell_label(i: int) -> str:
+    """
+    Return the label of the cell with index i: A to Z, then AA, AB and on.
+
+    >>> cell_label(0), cell_label(25), cell_label(26), cell_label(53)
+    ('A', 'Z', 'AA', 'BB')
+    """
+    if i < 26:
+        return chr(ord('A') + i)
+    return cell_label(i // 26 - 1) + chr(ord('A') + i % 26)
+
+
+def board_layout(sides: int) -> BoardLayout:
+    """
+    Return the shared BoardLayout for a board with sides sides, generating it
+    the first time.
+    """
+    if sides not in _BOARD_LAYOUTS:
+        _BOARD_LAYOUTS[sides] = BoardLayout(sides)
+    return _BOARD_LAYOUTS[sides]
+
+
+def encoded_bytes(sides: int) -> int:
+    """
+    Return the number of bytes in the encoding of a state of a board with
+    sides sides made by to_bytes: one for the number of sides, then one bit
+    for the player to move and two bits for every cell and leyline.
+
+    >>> [encoded_bytes(sides) for sides in range(1, 6)]
+    [4, 6, 8, 10, 12]
+    """
+    layout = board_layout(sides)
+    bits = 1 + 2 * len(layout.letters) + 2 * (3 * sides + 3)
+    return 1 + (bits + 7) // 8
+
+
 class StonhengeGame(Game):
     """
     Abstract class for a game to be played with two players for Stonehenge
     """
 
-    def __init__(self, p1_starts: bool) -> None:
+    def __init__(self, p1_starts: bool, sides: Optional[int] = None) -> None:
         """
         Initialize this Game, using p1_starts to find who the first player is.
+        The number of sides is asked for unless sides is given.
         """
-        side = int(input("Enter the number of sides: "))
-        self.current_state = StonehengeState(p1_starts, side)
+        if sides is None:
+            sides = int(input("Enter the number of sides: "))
+        self.current_state = StonehengeState(p1_starts, sides)
 
     def get_instructions(self) -> str:
         """
@@ -41,17 +267,7 @@ class StonhengeGame(Game):
         """
         Return whether or not this game is over at state.
         """
-        one_occ = 0
-        two_occ = 0
-        leylines = int((3 * state.sides) + 3)
-        for leys in state.current_hedge:
-            one_occ += state.current_hedge[leys][-1].count('1')
-            two_occ += state.current_hedge[leys][-1].count('2')
-        if one_occ >= (leylines / 2):
-            return True
-        elif two_occ >= (leylines / 2):
-            return True
-        return False
+        return state.over()
         # if the p1 or p2 has the majority of the hedges then it is over
 
     def is_winner(self, player: str) -> bool:
@@ -80,7 +296,38 @@ class StonehengeState(GameState):
 
     """
     The state of a game at a certain point in time for Stonehenge.
+
+    sides - the number of sides of the board
+    layout - the shared BoardLayout of the board
+    cells - the owner of every cell, in board order: 0 if nobody has claimed
+            it, 1 if p1 has and 2 if p2 has
+    lines - the owner of every leyline, in the order of layout.line_names
+    zobrist - a hash of the cells, leylines and current player, kept up to
+              date by every move
+    p1_leylines, p2_leylines - the number of leylines each player has claimed
+    empty - the cells nobody has claimed, as a bitmask over the board
+            layout's move_order
+
+    Only cells and lines change from state to state; the geometry of the
+    board lives in its layout, and states have no __dict__, so a state takes
+    a few hundred bytes. current_hedge gives the nested lists of letters and
+    marks of earlier versions.
+
+    Two states are equal when they have the same board, cells, leylines and
+    player to move. A state's hash changes with every move applied to it, so
+    only states that are no longer played on should be kept in sets or as
+    dictionary keys.
     """
+    __slots__ = ('sides', 'layout', 'cells', 'lines', 'zobrist',
+                 'p1_leylines', 'p2_leylines', 'empty', '_undo_stack')
+    sides: int
+    layout: BoardLayout
+    cells: bytearray
+    lines: bytearray
+    zobrist: int
+    p1_leylines: int
+    p2_leylines: int
+    empty: int
 
     def __init__(self, is_p1_turn: bool, sides: int) -> None:
         """
@@ -90,257 +337,71 @@ class StonehengeState(GameState):
         """
         super().__init__(is_p1_turn)
         self.sides = sides
-        if self.sides == 1:
-            self.current_hedge = {'-': [['A', 'B'], ['C'], ['@', '@']],
-                                  '/': [['A'], ['B', 'C'], ['@', '@']],
-                                  '\\': [['A', 'C'], ['B'], ['@', '@']]}
-        elif self.sides == 2:
-            self.current_hedge = {'-': [['A', 'B'], ['C', 'D', 'E'], ['F', 'G'],
-                                        ['@', '@', '@']],
-                                  '/': [['A', 'C'], ['B', 'D', 'F'], ['E', 'G'],
-                                        ['@', '@', '@']],
-                                  '\\': [['C', 'F'], ['A', 'D', 'G'],
-                                         ['B', 'E'], ['@', '@', '@']]}
-        elif self.sides == 3:
-            self.current_hedge = {'-': [['A', 'B'], ['C', 'D', 'E'],
-                                        ['F', 'G', 'H', 'I'], ['J', 'K', 'L'],
-                                        ['@', '@', '@', '@']],
-                                  '/': [['A', 'C', 'F'], ['B', 'D', 'G', 'J'],
-                                        ['E', 'H', 'K'], ['I', 'L'],
-                                        ['@', '@', '@', '@']],
-                                  '\\': [['F', 'J'], ['C', 'G', 'K'],
-                                         ['A', 'D', 'H', 'L'], ['B', 'E', 'I'],
-                                         ['@', '@', '@', '@']]}
-        elif self.sides == 4:
-            self.current_hedge = {'-': [['A', 'B'], ['C', 'D', 'E'],
-                                        ['F', 'G', 'H', 'I'],
-                                        ['J', 'K', 'L', 'M', 'N'],
-                                        ['O', 'P', 'Q', 'R'],
-                                        ['@', '@', '@', '@', '@']],
-                                  '/': [['A', 'C', 'F', 'J'],
-                                        ['B', 'D', 'G', 'K', 'O'],
-                                        ['E', 'H', 'L', 'P'], ['I', 'M', 'Q'],
-                                        ['N', 'R'], ['@', '@', '@', '@', '@']],
-                                  '\\': [['J', 'O'], ['F', 'K', 'P'],
-                                         ['C', 'G', 'L', 'Q'],
-                                         ['A', 'D', 'H', 'M', 'R'],
-                                         ['B', 'E', 'I', 'N'],
-                                         ['@', '@', '@', '@', '@']]}
-        elif self.sides == 5:
-            self.current_hedge = {'-': [['A', 'B'], ['C', 'D', 'E'],
-                                        ['F', 'G', 'H', 'I'],
-                                        ['J', 'K', 'L', 'M', 'N'],
-                                        ['O', 'P', 'Q', 'R', 'S', 'T'],
-                                        ['U', 'V', 'W', 'X', 'Y'],
-                                        ['@', '@', '@', '@', '@', '@']],
-                                  '/': [['A', 'C', 'F', 'J', 'O'],
-                                        ['B', 'D', 'G', 'K', 'P', 'U'],
-                                        ['E', 'H', 'L', 'Q', 'V'],
-                                        ['I', 'M', 'R', 'W'],
-                                        ['N', 'S', 'X'],
-                                        ['T', 'Y'],
-                                        ['@', '@', '@', '@', '@', '@']],
-                                  '\\': [['O', 'U'], ['J', 'P', 'V'],
-                                         ['F', 'K', 'Q', 'W'],
-                                         ['C', 'G', 'L', 'R', 'X'],
-                                         ['A', 'D', 'H', 'M', 'S', 'Y'],
-                                         ['B', 'E', 'I', 'N', 'T'],
-                                         ['@', '@', '@', '@', '@', '@']]}
+        layout = self.layout = board_layout(sides)
+        self.cells = bytearray(len(layout.letters))
+        self.lines = bytearray(len(layout.line_names))
+        self.zobrist = layout.board_key
+        if is_p1_turn:
+            self.zobrist ^= layout.turn_key
+        self.p1_leylines = 0
+        self.p2_leylines = 0
+        self.empty = (1 << len(layout.letters)) - 1
+        self._undo_stack = None
+
+    @property
+    def empty_cells(self) -> int:
+        """
+        Return the number of cells nobody has claimed.
+        """
+        return self.empty.bit_count()
+
+    @property
+    def current_hedge(self) -> Dict[str, List[List[str]]]:
+        """
+        Return the cells of every leyline, by direction, as the letters of
+        the unclaimed cells and '1' or '2' for claimed ones, followed by the
+        leyline markers: '@' for an unclaimed leyline, '1' or '2' otherwise.
+
+        The lists are built on every call; changing them does not change
+        this state.
+
+        >>> StonehengeState(True, 1).make_move('A').current_hedge['-']
+        [['1', 'B'], ['C'], ['1', '@']]
+        """
+        layout = self.layout
+        cells = self.cells
+        marks = [letter if not owner else MARKS[owner]
+                 for letter, owner in zip(layout.letters, cells)]
+        hedge = {leys: [] for leys in layout.leylines}
+        for (leys, _), line_cells in zip(layout.line_names,
+                                         layout.line_cells):
+            hedge[leys].append([marks[cell] for cell in line_cells])
+        for leys in hedge:
+            hedge[leys].append([])
+        for (leys, _), owner in zip(layout.line_names, self.lines):
+            hedge[leys][-1].append(MARKS[owner])
+        return hedge
 
     def __str__(self) -> str:
         """
         Return a string representation of the current state of the game.
+
+        >>> print(StonehengeState(True, 1))
+              @   @
+             /   /
+        @ - A - B
+             \\ / \\
+          @ - C   @
+               \\
+                @
+        <BLANKLINE>
         """
-        if self.sides == 1:
-            return "      {}   {}\n" \
-                   "     /   / \n" \
-                   "{} - {} - {}\n" \
-                   "     \\ / \\\n" \
-                   "  {} - {}   {}\n" \
-                   "       \\\n" \
-                   "        {}\n"\
-                .format(self.current_hedge['/'][2][0],
-                        self.current_hedge['/'][2][1],
-                        self.current_hedge['-'][2][0],
-                        self.current_hedge['-'][0][0],
-                        self.current_hedge['-'][0][1],
-                        self.current_hedge['-'][2][1],
-                        self.current_hedge['-'][1][0],
-                        self.current_hedge['\\'][2][1],
-                        self.current_hedge['\\'][2][0])
-
-        elif self.sides == 2:
-            return "        {}   {}\n" \
-                   "       /   /\n" \
-                   "  {} - {} - {}   {}\n" \
-                   "     / \\ / \\ /\n" \
-                   "{} - {} - {} - {}\n" \
-                   "     \\ / \\ / \\ \n" \
-                   "  {} - {} - {}   {}\n" \
-                   "       \\   \\ \n" \
-                   "        {}   {}\n "\
-                .format(self.current_hedge['/'][-1][0],
-                        self.current_hedge['/'][-1][1],
-                        self.current_hedge['-'][-1][0],
-                        self.current_hedge['-'][0][0],
-                        self.current_hedge['-'][0][1],
-                        self.current_hedge['/'][-1][2],
-                        self.current_hedge['-'][-1][1],
-                        self.current_hedge['-'][1][0],
-                        self.current_hedge['-'][1][1],
-                        self.current_hedge['-'][1][2],
-                        self.current_hedge['-'][-1][2],
-                        self.current_hedge['-'][2][0],
-                        self.current_hedge['-'][2][1],
-                        self.current_hedge['\\'][-1][2],
-                        self.current_hedge['\\'][-1][0],
-                        self.current_hedge['\\'][-1][1])
-
-        elif self.sides == 3:
-            return "          {}   {}\n" \
-                   "         /   /\n" \
-                   "    {} - {} - {}   {}\n" \
-                   "       / \\ / \\ /\n" \
-                   "  {} - {} - {} - {}   {}\n" \
-                   "     / \\ / \\ / \\ /\n" \
-                   "{} - {} - {} - {} - {}\n" \
-                   "     \\ / \\ / \\ / \\ \n " \
-                   " {} - {} – {} - {}   {}\n" \
-                   "       \\   \\   \\ \n" \
-                   "        {}   {}   {} \n"\
-                .format(self.current_hedge['/'][-1][0],
-                        self.current_hedge['/'][-1][1],
-                        self.current_hedge['-'][-1][0],
-                        self.current_hedge['-'][0][0],
-                        self.current_hedge['-'][0][1],
-                        self.current_hedge['/'][-1][2],
-                        self.current_hedge['-'][-1][1],
-                        self.current_hedge['-'][1][0],
-                        self.current_hedge['-'][1][1],
-                        self.current_hedge['-'][1][2],
-                        self.current_hedge['/'][-1][3],
-                        self.current_hedge['-'][-1][2],
-                        self.current_hedge['-'][2][0],
-                        self.current_hedge['-'][2][1],
-                        self.current_hedge['-'][2][2],
-                        self.current_hedge['-'][2][3],
-                        self.current_hedge['-'][-1][3],
-                        self.current_hedge['-'][3][0],
-                        self.current_hedge['-'][3][1],
-                        self.current_hedge['-'][3][2],
-                        self.current_hedge['\\'][-1][3],
-                        self.current_hedge['\\'][-1][0],
-                        self.current_hedge['\\'][-1][1],
-                        self.current_hedge['\\'][-1][2])
-
-        elif self.sides == 4:
-            return "            {}   {}\n" \
-                   "           /   /\n" \
-                   "      {} - {} - {}   {}\n" \
-                   "         / \\ / \\ /\n" \
-                   "    {} - {} - {} - {}   {}\n" \
-                   "       / \\ / \\ / \\ /\n" \
-                   "  {} - {} - {} - {} – {}   {} \n" \
-                   "     / \\ / \\ / \\ / \\ / \n" \
-                   "{} - {} - {} - {} - {} - {} \n" \
-                   "     \\ / \\ / \\ / \\ / \\ \n" \
-                   "  {} - {} – {} - {} – {}   {} \n" \
-                   "       \\   \\   \\   \\ \n" \
-                   "        {}   {}   {}   {} \n"\
-                .format(self.current_hedge['/'][-1][0],
-                        self.current_hedge['/'][-1][1],
-                        self.current_hedge['-'][-1][0],
-                        self.current_hedge['-'][0][0],
-                        self.current_hedge['-'][0][1],
-                        self.current_hedge['/'][-1][2],
-                        self.current_hedge['-'][-1][1],
-                        self.current_hedge['-'][1][0],
-                        self.current_hedge['-'][1][1],
-                        self.current_hedge['-'][1][2],
-                        self.current_hedge['/'][-1][3],
-                        self.current_hedge['-'][-1][2],
-                        self.current_hedge['-'][2][0],
-                        self.current_hedge['-'][2][1],
-                        self.current_hedge['-'][2][2],
-                        self.current_hedge['-'][2][3],
-                        self.current_hedge['/'][-1][4],
-                        self.current_hedge['-'][-1][3],
-                        self.current_hedge['-'][3][0],
-                        self.current_hedge['-'][3][1],
-                        self.current_hedge['-'][3][2],
-                        self.current_hedge['-'][3][3],
-                        self.current_hedge['-'][3][4],
-                        self.current_hedge['-'][-1][4],
-                        self.current_hedge['-'][4][0],
-                        self.current_hedge['-'][4][1],
-                        self.current_hedge['-'][4][2],
-                        self.current_hedge['-'][4][3],
-                        self.current_hedge['\\'][-1][4],
-                        self.current_hedge['\\'][-1][0],
-                        self.current_hedge['\\'][-1][1],
-                        self.current_hedge['\\'][-1][2],
-                        self.current_hedge['\\'][-1][3])
-
-        elif self.sides == 5:
-            return "              {}   {}\n" \
-                   "             /   /\n" \
-                   "        {} - {} - {}   {}\n" \
-                   "           / \\ / \\ /\n" \
-                   "      {} - {} - {} - {}   {}\n" \
-                   "         / \\ / \\ / \\ /\n" \
-                   "    {} - {} - {} - {} – {}   {} \n" \
-                   "       / \\ / \\ / \\ / \\ / \n" \
-                   "  {} - {} - {} - {} - {} - {}   {}\n" \
-                   "     / \\ / \\ / \\ / \\ / \\ / \n" \
-                   "{} - {} - {} - {} - {} - {} - {}  \n" \
-                   "     \\ / \\ / \\ / \\ / \\ / \\  \n" \
-                   "  {} - {} - {} - {} - {} - {}   {} \n" \
-                   "       \\   \\   \\   \\   \\ \n" \
-                   "        {}   {}   {}   {}   {} \n"\
-                .format(self.current_hedge['/'][-1][0],
-                        self.current_hedge['/'][-1][1],
-                        self.current_hedge['-'][-1][0],
-                        self.current_hedge['-'][0][0],
-                        self.current_hedge['-'][0][1],
-                        self.current_hedge['/'][-1][2],
-                        self.current_hedge['-'][-1][1],
-                        self.current_hedge['-'][1][0],
-                        self.current_hedge['-'][1][1],
-                        self.current_hedge['-'][1][2],
-                        self.current_hedge['/'][-1][3],
-                        self.current_hedge['-'][-1][2],
-                        self.current_hedge['-'][2][0],
-                        self.current_hedge['-'][2][1],
-                        self.current_hedge['-'][2][2],
-                        self.current_hedge['-'][2][3],
-                        self.current_hedge['/'][-1][4],
-                        self.current_hedge['-'][-1][3],
-                        self.current_hedge['-'][3][0],
-                        self.current_hedge['-'][3][1],
-                        self.current_hedge['-'][3][2],
-                        self.current_hedge['-'][3][3],
-                        self.current_hedge['-'][3][4],
-                        self.current_hedge['/'][-1][5],
-                        self.current_hedge['-'][-1][4],
-                        self.current_hedge['-'][4][0],
-                        self.current_hedge['-'][4][1],
-                        self.current_hedge['-'][4][2],
-                        self.current_hedge['-'][4][3],
-                        self.current_hedge['-'][4][4],
-                        self.current_hedge['-'][4][5],
-                        self.current_hedge['-'][-1][5],
-                        self.current_hedge['-'][5][0],
-                        self.current_hedge['-'][5][1],
-                        self.current_hedge['-'][5][2],
-                        self.current_hedge['-'][5][3],
-                        self.current_hedge['-'][5][4],
-                        self.current_hedge['\\'][-1][5],
-                        self.current_hedge['\\'][-1][0],
-                        self.current_hedge['\\'][-1][1],
-                        self.current_hedge['\\'][-1][2],
-                        self.current_hedge['\\'][-1][3],
-                        self.current_hedge['\\'][-1][4])
-        return ''
+        layout = self.layout
+        cells, lines, letters = self.cells, self.lines, layout.letters
+        return layout.template.format(*[
+            (MARKS[cells[source]] if cells[source] else letters[source])
+            if source >= 0 else MARKS[lines[~source]]
+            for source in layout.sources])
 
     def get_possible_moves(self) -> list:
         """
@@ -352,57 +413,240 @@ class StonehengeState(GameState):
         >>> state.get_possible_moves()
         ['A', 'B', 'C', 'D', 'E', 'F', 'G']
         """
-        one_occ = 0
-        two_occ = 0
-        leylines = int((3 * self.sides) + 3)
-        for leys in self.current_hedge:
-            one_occ += self.current_hedge[leys][-1].count('1')
-            two_occ += self.current_hedge[leys][-1].count('2')
-        if one_occ >= (leylines / 2):
-            return []
-        elif two_occ >= (leylines / 2):
+        if self.over():
             return []
+        letters = self.layout.move_order
+        empty = self.empty
         moves = []
-        for leys in self.current_hedge:
-            for lists in self.current_hedge[leys]:
-                for letter in lists:
-                    if letter.isalpha() is True:
-                        moves.append(letter)
-        good_moves = list(set(moves))
-        good_moves.sort()
-        return good_moves
+        while empty:
+            low = empty & -empty
+            moves.append(letters[low.bit_length() - 1])
+            empty ^= low
+        return moves
+
+    def iter_moves(self, ordered: bool = False) -> Iterator[str]:
+        """
+        Yield the possible moves of this state one at a time, in sorted order,
+        or most urgent first (by move_priority) if ordered.
+
+        >>> state = StonehengeState(True, 2).make_move('A').make_move('D')
+        >>> next(state.iter_moves()), list(state.iter_moves(True))[:2]
+        ('B', ['G', 'E'])
+        """
+        if self.over():
+            return
+        if ordered:
+            yield from sorted(self.get_possible_moves(),
+                              key=self.move_priority, reverse=True)
+            return
+        letters = self.layout.move_order
+        empty = self.empty
+        while empty:
+            low = empty & -empty
+            yield letters[low.bit_length() - 1]
+            empty ^= low
 
     def make_move(self, move: Any) -> 'GameState':
         """
         Return the GameState that results from applying move to this GameState.
         """
-
-        new_state = copy.deepcopy(self)
-
-        for leys in new_state.current_hedge:
-            for lines in new_state.current_hedge[leys]:
-                for i in range(len(lines)):
-                    if lines[i] == move:
-                        if self.p1_turn is True:
-                            lines[i] = '1'
-                        elif self.p1_turn is False:
-                            lines[i] = '2'
-        for leys in new_state.current_hedge:
-            for i in range(len(new_state.current_hedge[leys]) - 1):
-                if new_state.current_hedge[leys][i].count('1') >= \
-                        (len(new_state.current_hedge[leys][i]) / 2) and \
-                        new_state.current_hedge[leys][-1][i] != '2':
-                    new_state.current_hedge[leys][-1][i] = '1'
-                elif new_state.current_hedge[leys][i].count('2') >= \
-                        (len(new_state.current_hedge[leys][i]) / 2) and \
-                        new_state.current_hedge[leys][-1][i] != '1':
-                    new_state.current_hedge[leys][-1][i] = '2'
-        if new_state.p1_turn is True:
-            new_state.p1_turn = False
-        elif new_state.p1_turn is False:
-            new_state.p1_turn = True
+        new_state = StonehengeState.__new__(StonehengeState)
+        new_state.p1_turn = self.p1_turn
+        new_state.sides = self.sides
+        new_state.layout = self.layout
+        new_state.cells = self.cells[:]
+        new_state.lines = self.lines[:]
+        new_state.zobrist = self.zobrist
+        new_state.p1_leylines = self.p1_leylines
+        new_state.p2_leylines = self.p2_leylines
+        new_state.empty = self.empty
+        new_state._undo_stack = None
+        new_state._play_move(move)
         return new_state
 
+    def is_valid_move(self, move: Any) -> bool:
+        """
+        Return whether move is a valid move for this GameState.
+
+        >>> state = StonehengeState(True, 2)
+        >>> state.is_valid_move('D'), state.make_move('D').is_valid_move('D')
+        (True, False)
+        """
+        bit = self.layout.move_bits.get(move) \
+            if isinstance(move, str) else None
+        return bit is not None and bool(self.empty >> bit & 1) and \
+            not self.over()
+
+    def apply_move(self, move: Any) -> None:
+        """
+        Apply move to this state in place, remembering the cell and leylines
+        it claims so that undo_move can restore them.
+
+        >>> state = StonehengeState(True, 2)
+        >>> state.apply_move('A')
+        >>> state.get_possible_moves()
+        ['B', 'C', 'D', 'E', 'F', 'G']
+        >>> state.undo_move()
+        >>> state.get_possible_moves()
+        ['A', 'B', 'C', 'D', 'E', 'F', 'G']
+        """
+        if self._undo_stack is None:
+            self._undo_stack = []
+        counts = (self.zobrist, self.p1_leylines, self.p2_leylines,
+                  self.empty)
+        self._undo_stack.append((self._play_move(move), counts))
+
+    def undo_move(self) -> None:
+        """
+        Take back the last move applied with apply_move.
+        """
+        claimed, (self.zobrist, self.p1_leylines, self.p2_leylines,
+                  self.empty) = self._undo_stack.pop()
+        if claimed is not None:
+            cell, lines = claimed
+            self.cells[cell] = 0
+            for line in lines:
+                self.lines[line] = 0
+        self.p1_turn = not self.p1_turn
+
+    def _play_move(self, move: Any) -> Optional[Tuple[int, List[int]]]:
+        """
+        Apply move to this state in place, updating its Zobrist hash and
+        counts, and return the cell it claims with the leylines that
+        claims, or None if move is not an unclaimed cell.
+
+        Only the leylines through move are looked at.
+        """
+        layout = self.layout
+        cell = layout.index.get(move)
+        claimed = None
+        if cell is not None and not self.cells[cell]:
+            owner = 1 if self.p1_turn else 2
+            cells, lines = self.cells, self.lines
+            cells[cell] = owner
+            line_keys = layout.line_keys[owner - 1]
+            claimed = (cell, [])
+            for line in layout.cell_lines[cell]:
+                if lines[line]:
+                    continue
+                owners = layout.line_owners[line](cells)
+                if 2 * owners.count(owner) >= len(owners):
+                    lines[line] = owner
+                    claimed[1].append(line)
+                    self.zobrist ^= line_keys[line]
+                    if owner == 1:
+                        self.p1_leylines += 1
+                    else:
+                        self.p2_leylines += 1
+            self.zobrist ^= layout.cell_keys[owner - 1][cell]
+            self.empty ^= layout.cell_bits[cell]
+        self.zobrist ^= layout.turn_key
+        self.p1_turn = not self.p1_turn
+        return claimed
+
+    def to_int(self) -> int:
+        """
+        Return this state encoded as an integer: bit 0 is set if p1 is to
+        move, then every cell (in board order) and every leyline (by
+        direction) takes two bits: 0 if nobody has claimed it, 1 if p1 has
+        and 2 if p2 has.
+
+        >>> StonehengeState(False, 1).make_move('A').to_int()
+        69893
+        """
+        code = 0
+        for owner in reversed(self.lines):
+            code = code << 2 | owner
+        for owner in reversed(self.cells):
+            code = code << 2 | owner
+        return code << 1 | int(self.p1_turn)
+
+    @classmethod
+    def from_int(cls, code: int, sides: int) -> 'StonehengeState':
+        """
+        Return the state of a board with sides sides that to_int encoded as
+        code.
+
+        >>> state = StonehengeState(True, 3).make_move('E').make_move('B')
+        >>> copy = StonehengeState.from_int(state.to_int(), 3)
+        >>> copy == state, copy.zobrist == state.zobrist, copy.p2_leylines
+        (True, True, 1)
+        """
+        state = cls(bool(code & 1), sides)
+        layout = state.layout
+        code >>= 1
+        for cell in range(len(state.cells)):
+            owner = code & 3
+            if owner:
+                state.cells[cell] = owner
+                state.zobrist ^= layout.cell_keys[owner - 1][cell]
+                state.empty ^= layout.cell_bits[cell]
+            code >>= 2
+        for line in range(len(state.lines)):
+            owner = code & 3
+            if owner:
+                state.lines[line] = owner
+                state.zobrist ^= layout.line_keys[owner - 1][line]
+                if owner == 1:
+                    state.p1_leylines += 1
+                else:
+                    state.p2_leylines += 1
+            code >>= 2
+        return state
+
+    def to_bytes(self) -> bytes:
+        """
+        Return this state encoded in encoded_bytes(sides) bytes: the number
+        of sides, then to_int() in little-endian order.
+
+        >>> data = StonehengeState(True, 2).make_move('D').to_bytes()
+        >>> len(data), StonehengeState.from_bytes(data).get_possible_moves()
+        (6, ['A', 'B', 'C', 'E', 'F', 'G'])
+        """
+        return bytes([self.sides]) + self.to_int().to_bytes(
+            encoded_bytes(self.sides) - 1, 'little')
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'StonehengeState':
+        """
+        Return the state that to_bytes encoded as data.
+        """
+        return cls.from_int(int.from_bytes(data[1:], 'little'), data[0])
+
+    def __reduce__(self) -> Tuple[Any, Tuple[bytes]]:
+        """
+        Return how to rebuild this state, for pickle and copy: from its
+        to_bytes encoding, so the shared BoardLayout is not copied with it.
+
+        >>> import pickle
+        >>> state = StonehengeState(True, 3).make_move('E')
+        >>> copy = pickle.loads(pickle.dumps(state))
+        >>> copy == state, copy.layout is state.layout
+        (True, True)
+        """
+        return type(self).from_bytes, (self.to_bytes(),)
+
+    def __eq__(self, other: Any) -> bool:
+        """
+        Return whether this state and other have the same board, cells,
+        leylines and player to move.
+
+        >>> StonehengeState(True, 2).make_move('A').make_move('B') == \\
+        ...     StonehengeState(True, 2).make_move('A').make_move('B')
+        True
+        >>> StonehengeState(True, 2) == StonehengeState(False, 2)
+        False
+        """
+        return type(other) is type(self) and self.sides == other.sides and \
+            self.zobrist == other.zobrist and self.to_int() == other.to_int()
+
+    def __hash__(self) -> int:
+        """
+        Return a hash of this state's board, cells, leylines and player to
+        move.
+        """
+        return hash((self.sides, self.zobrist))
+
     def __repr__(self) -> Any:
         """
         Return a representation of this state (which can be used for
@@ -414,14 +658,13 @@ class StonehengeState(GameState):
         >>> state = StonehengeState(True, 2)
         >>> state.__repr__()
         "P1's Turn: True - P1's Leylines 0 - P2's Leylines 0 - LeyLines Left: 9"
+        >>> state.make_move('A').__repr__().split(' - ')[1:]
+        ["P1's Leylines 2", "P2's Leylines 0", 'LeyLines Left: 9']
         """
-        one_occ = 0
-        two_occ = 0
-        leylines = int((3 * self.sides) + 3)
-        leys_left = (leylines - one_occ - two_occ)
-        for leys in self.current_hedge:
-            one_occ += self.current_hedge[leys][-1].count('1')
-            two_occ += self.current_hedge[leys][-1].count('2')
+        one_occ = self.p1_leylines
+        two_occ = self.p2_leylines
+        # 'LeyLines Left' has always been the total number of leylines.
+        leys_left = 3 * self.sides + 3
         return "P1's Turn: {} - P1's Leylines {} - P2's Leylines {} " \
                "- LeyLines Left: {}"\
             .format(self.p1_turn, one_occ, two_occ, leys_left)
@@ -431,42 +674,133 @@ class StonehengeState(GameState):
         Return an estimate in interval [LOSE, WIN] of best outcome the current
         player can guarantee from state self.
 
+        WIN if the current player can win with one move, LOSE if the game is
+        over or every move leaves the other player a winning move, and DRAW
+        otherwise. Worked out from the leyline counts, without building any
+        child states.
+
         >>> state = StonehengeState(True, 1)
         >>> state.rough_outcome()
         1
+        >>> state.make_move('B').rough_outcome()
+        -1
         """
-        scores = [self.make_move(j) for j in self.get_possible_moves()]
-        p11 = []
-        scores_1 = []
-        for moves in scores:
-            p11.append(moves.over())
-        for othermoves in scores:
-            scores_1.append([self.make_move(k)
-                             for k in othermoves.get_possible_moves()])
-        for othermoves1 in scores_1:
-            for k in othermoves1:
-                k.over()
-        if True in p11:
-            return self.WIN
-        elif (True in u for u in scores_1):
+        if self.over():
             return self.LOSE
-        return self.DRAW
+        mine_owner, their_owner = (1, 2) if self.p1_turn else (2, 1)
+        needed = (3 * self.sides + 4) // 2
+        layout = self.layout
+        cells = self.cells
+        my_gains = {}
+        their_gains = {}
+        contested = []
+        for line, owner in enumerate(self.lines):
+            if owner:
+                continue
+            owners = layout.line_owners[line](cells)
+            half = len(owners) / 2 - 1
+            mine = owners.count(mine_owner) >= half
+            theirs = owners.count(their_owner) >= half
+            if not (mine or theirs):
+                continue
+            empty = [layout.letters[cell] for cell in layout.line_cells[line]
+                     if not cells[cell]]
+            if mine:
+                for letter in empty:
+                    my_gains[letter] = my_gains.get(letter, 0) + 1
+            if theirs:
+                for letter in empty:
+                    their_gains[letter] = their_gains.get(letter, 0) + 1
+                if mine:
+                    contested.append(empty)
+        my_lines, their_lines = (self.p1_leylines, self.p2_leylines) \
+            if self.p1_turn else (self.p2_leylines, self.p1_leylines)
+        if my_lines + max(my_gains.values(), default=0) >= needed:
+            return self.WIN
+        threats = [letter for letter in their_gains
+                   if their_lines + their_gains[letter] >= needed]
+        if not threats:
+            return self.DRAW
+        # Only a move on a threat, or one claiming a leyline a threat needs,
+        # can stop the other player from winning next move.
+        defences = set(threats)
+        for empty in contested:
+            defences.update(empty)
+        for move in defences:
+            blocked = {}
+            for empty in contested:
+                if move in empty:
+                    for letter in empty:
+                        blocked[letter] = blocked.get(letter, 0) + 1
+            if not any(letter != move and their_lines + their_gains[letter] -
+                       blocked.get(letter, 0) >= needed
+                       for letter in threats):
+                return self.DRAW
+        return self.LOSE
+
+    def evaluate(self) -> float:
+        """
+        Return a heuristic score strictly between LOSE and WIN for the
+        current player, from how far each player is along every leyline.
+
+        A claimed leyline counts fully for its owner, and an unclaimed one
+        counts by the difference in cells each player has on it.
+
+        >>> StonehengeState(True, 2).evaluate()
+        0.0
+        >>> StonehengeState(True, 2).make_move('D').evaluate() < 0
+        True
+        """
+        mine, theirs = (1, 2) if self.p1_turn else (2, 1)
+        cells = self.cells
+        score = 0.0
+        leylines = 0
+        for line_owners, owner in zip(self.layout.line_owners, self.lines):
+            leylines += 1
+            if owner == mine:
+                score += 1
+            elif owner == theirs:
+                score -= 1
+            else:
+                owners = line_owners(cells)
+                score += (owners.count(mine) - owners.count(theirs)) / \
+                    len(owners)
+        return 0.9 * score / max(leylines, 1)
+
+    def move_priority(self, move: Any) -> int:
+        """
+        Return how urgent move is for the current player: 3 for every
+        leyline it would claim, 2 for every leyline it stops the other player
+        from claiming next move, and 1 for every other unclaimed leyline
+        the other player is already on.
+
+        >>> state = StonehengeState(True, 2).make_move('A').make_move('D')
+        >>> state.move_priority('B'), state.move_priority('G')
+        (5, 9)
+        """
+        mine, theirs = (1, 2) if self.p1_turn else (2, 1)
+        layout = self.layout
+        cells = self.cells
+        priority = 0
+        for line in layout.cell_lines[layout.index[move]]:
+            if self.lines[line]:
+                continue
+            owners = layout.line_owners[line](cells)
+            if owners.count(mine) + 1 >= len(owners) / 2:
+                priority += 3
+            elif owners.count(theirs) + 1 >= len(owners) / 2:
+                priority += 2
+            elif theirs in owners:
+                priority += 1
+        return priority
 
     def over(self) -> bool:
         """
         Return whether or not this game is over at state.
         """
-        one_occ = 0
-        two_occ = 0
-        leylines = int((3 * self.sides) + 3)
-        for leys in self.current_hedge:
-            one_occ += self.current_hedge[leys][-1].count('1')
-            two_occ += self.current_hedge[leys][-1].count('2')
-        if one_occ >= (leylines / 2):
-            return True
-        elif two_occ >= (leylines / 2):
-            return True
-        return False
+        leylines = 3 * self.sides + 3
+        return self.p1_leylines * 2 >= leylines or \
+            self.p2_leylines * 2 >= leylines
 
 
 if __name__ == "__main__":
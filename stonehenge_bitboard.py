@@ -0,0 +1,557 @@
+"""
+A bitboard implementation of the Stonehenge game state.
+
+Cell ownership and leyline ownership are packed into one integer per player,
+so making a move only needs a handful of integer operations instead of a
+deepcopy of the nested current_hedge lists.
+"""
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import random
+from game_state import GameState
+from stonehenge import StonhengeGame, StonehengeState, board_layout, \
+    encoded_bytes
+
+
+DIRECTIONS = ('-', '/', '\\')
+
+
+class BitboardLayout:
+    """
+    The fixed geometry of a Stonehenge board with a given number of sides.
+
+    letters - the cell letters, in sorted order (bit i is letters[i])
+    index - maps a cell letter to its bit position
+    board_order - the bit position of every cell, in the order of the board
+                  layout (the order of the to_int encoding)
+    positions - the (direction, line index, position) of each cell in a
+                StonehengeState's current_hedge
+    line_masks - the cell mask of every leyline, ordered by direction
+    line_needed - the number of cells needed to claim each leyline
+    cell_lines - the leylines each cell belongs to
+    win_needed - the number of leylines needed to win
+    cell_keys, line_keys - the Zobrist keys of each cell and leyline, for p1
+                           and p2
+    turn_key - the Zobrist key for p1 to move
+    board_key - the Zobrist key every state of this board starts from, so
+                equal positions on boards of different sizes hash apart
+    """
+    letters: List[str]
+    index: Dict[str, int]
+    board_order: List[int]
+    positions: List[Tuple[str, int, int]]
+    line_masks: List[int]
+    line_needed: List[int]
+    cell_lines: List[List[int]]
+    win_needed: int
+    cell_keys: List[List[int]]
+    line_keys: List[List[int]]
+    turn_key: int
+    board_key: int
+
+    def __init__(self, sides: int) -> None:
+        """
+        Build the layout of a board with sides sides from the leylines of its
+        BoardLayout.
+        """
+        leylines = board_layout(sides).leylines
+        self.letters = sorted({letter for leys in DIRECTIONS
+                               for lines in leylines[leys]
+                               for letter in lines})
+        self.index = {letter: i for i, letter in enumerate(self.letters)}
+        self.board_order = [self.index[letter]
+                            for letter in board_layout(sides).letters]
+        self.positions = [('-', 0, 0)] * len(self.letters)
+        self.line_masks = []
+        self.line_needed = []
+        self.cell_lines = [[] for _ in self.letters]
+        for leys in DIRECTIONS:
+            for line, lines in enumerate(leylines[leys]):
+                mask = 0
+                for pos, letter in enumerate(lines):
+                    self.positions[self.index[letter]] = (leys, line, pos)
+                    mask |= 1 << self.index[letter]
+                    self.cell_lines[self.index[letter]].append(
+                        len(self.line_masks))
+                self.line_masks.append(mask)
+                self.line_needed.append((len(lines) + 1) // 2)
+        self.win_needed = (len(self.line_masks) + 1) // 2
+        generator = random.Random(sides)
+        self.turn_key = generator.getrandbits(64)
+        self.cell_keys = [[generator.getrandbits(64) for _ in self.letters]
+                          for _ in range(2)]
+        self.line_keys = [[generator.getrandbits(64) for _ in self.line_masks]
+                          for _ in range(2)]
+        self.board_key = generator.getrandbits(64)
+
+
+_LAYOUTS: Dict[int, BitboardLayout] = {}
+
+
+def get_layout(sides: int) -> BitboardLayout:
+    """
+    Return the shared BitboardLayout for a board with sides sides.
+    """
+    if sides not in _LAYOUTS:
+        _LAYOUTS[sides] = BitboardLayout(sides)
+    return _LAYOUTS[sides]
+
+
+class BitboardStonehengeState(GameState):
+    """
+    The state of a game of Stonehenge, stored as bitboards.
+
+    sides - the number of sides of the board
+    layout - the shared geometry of the board
+    p1_cells, p2_cells - the cells claimed by each player, one bit per cell
+    p1_lines, p2_lines - the leylines claimed by each player, one bit per
+                         leyline
+    zobrist - a hash of the cells, leylines and current player, kept up to
+              date by every move
+
+    States are equal and hashed like StonehengeState: by board, cells,
+    leylines and player to move.
+    """
+    __slots__ = ('sides', 'layout', 'p1_cells', 'p2_cells', 'p1_lines',
+                 'p2_lines', 'zobrist', '_undo_stack')
+    sides: int
+    layout: BitboardLayout
+    p1_cells: int
+    p2_cells: int
+    p1_lines: int
+    p2_lines: int
+    zobrist: int
+
+    def __init__(self, is_p1_turn: bool, sides: int) -> None:
+        """
+        Initialize this game state and set the current player based on
+        is_p1_turn.
+
+        >>> state = BitboardStonehengeState(True, 2)
+        >>> state.get_possible_moves()
+        ['A', 'B', 'C', 'D', 'E', 'F', 'G']
+        """
+        super().__init__(is_p1_turn)
+        self.sides = sides
+        self.layout = get_layout(sides)
+        self.p1_cells = 0
+        self.p2_cells = 0
+        self.p1_lines = 0
+        self.p2_lines = 0
+        self.zobrist = self.layout.board_key
+        if is_p1_turn:
+            self.zobrist ^= self.layout.turn_key
+        self._undo_stack = None
+
+    @classmethod
+    def from_state(cls, state: Any) -> 'BitboardStonehengeState':
+        """
+        Return a BitboardStonehengeState with the same cells, leylines and
+        current player as the StonehengeState or BitboardStonehengeState
+        state.
+
+        >>> state = StonehengeState(True, 2).make_move('A').make_move('D')
+        >>> BitboardStonehengeState.from_state(state).get_possible_moves()
+        ['B', 'C', 'E', 'F', 'G']
+        """
+        if isinstance(state, BitboardStonehengeState):
+            return cls.unpack(state.pack())
+        layout = get_layout(state.sides)
+        owned = [0, 0, 0]
+        for cell, owner in zip(layout.board_order, state.cells):
+            owned[owner] |= 1 << cell
+        lines = [0, 0, 0]
+        for line, owner in enumerate(state.lines):
+            lines[owner] |= 1 << line
+        return cls.unpack((state.sides, state.p1_turn, owned[1], owned[2],
+                           lines[1], lines[2]))
+
+    def pack(self) -> Tuple[int, bool, int, int, int, int]:
+        """
+        Return this state as a tuple of plain values, cheap to pickle and
+        send to another process.
+        """
+        return (self.sides, self.p1_turn, self.p1_cells, self.p2_cells,
+                self.p1_lines, self.p2_lines)
+
+    @classmethod
+    def unpack(cls, packed: Tuple[int, bool, int, int, int, int]) \
+            -> 'BitboardStonehengeState':
+        """
+        Return the state that pack() turned into packed.
+
+        >>> state = BitboardStonehengeState(False, 3).make_move('E')
+        >>> copy = BitboardStonehengeState.unpack(state.pack())
+        >>> copy.pack() == state.pack(), copy.zobrist == state.zobrist
+        (True, True)
+        """
+        sides, p1_turn, p1_cells, p2_cells, p1_lines, p2_lines = packed
+        state = cls(p1_turn, sides)
+        layout = state.layout
+        state.p1_cells, state.p2_cells = p1_cells, p2_cells
+        state.p1_lines, state.p2_lines = p1_lines, p2_lines
+        for player, (cells, lines) in enumerate(((p1_cells, p1_lines),
+                                                 (p2_cells, p2_lines))):
+            for cell, key in enumerate(layout.cell_keys[player]):
+                if cells >> cell & 1:
+                    state.zobrist ^= key
+            for line, key in enumerate(layout.line_keys[player]):
+                if lines >> line & 1:
+                    state.zobrist ^= key
+        return state
+
+    def to_int(self) -> int:
+        """
+        Return this state encoded as an integer, the same way as
+        StonehengeState.to_int.
+
+        >>> state = StonehengeState(True, 2).make_move('A').make_move('F')
+        >>> BitboardStonehengeState.from_state(state).to_int() == \\
+        ...     state.to_int()
+        True
+        """
+        code = int(self.p1_turn)
+        shift = 1
+        p1_cells, p2_cells = self.p1_cells, self.p2_cells
+        for cell in self.layout.board_order:
+            if p1_cells >> cell & 1:
+                code |= 1 << shift
+            elif p2_cells >> cell & 1:
+                code |= 2 << shift
+            shift += 2
+        p1_lines, p2_lines = self.p1_lines, self.p2_lines
+        for line in range(len(self.layout.line_masks)):
+            if p1_lines >> line & 1:
+                code |= 1 << shift
+            elif p2_lines >> line & 1:
+                code |= 2 << shift
+            shift += 2
+        return code
+
+    @classmethod
+    def from_int(cls, code: int, sides: int) -> 'BitboardStonehengeState':
+        """
+        Return the state of a board with sides sides that to_int encoded as
+        code.
+        """
+        layout = get_layout(sides)
+        p1_turn = bool(code & 1)
+        code >>= 1
+        owned = [0, 0, 0]
+        for cell in layout.board_order:
+            owned[code & 3] |= 1 << cell
+            code >>= 2
+        lines = [0, 0, 0]
+        for line in range(len(layout.line_masks)):
+            lines[code & 3] |= 1 << line
+            code >>= 2
+        return cls.unpack((sides, p1_turn, owned[1], owned[2], lines[1],
+                           lines[2]))
+
+    def to_bytes(self) -> bytes:
+        """
+        Return this state encoded in encoded_bytes(sides) bytes, the same
+        way as StonehengeState.to_bytes.
+
+        >>> state = BitboardStonehengeState(False, 4).make_move('J')
+        >>> BitboardStonehengeState.from_bytes(state.to_bytes()) == state
+        True
+        """
+        return bytes([self.sides]) + self.to_int().to_bytes(
+            encoded_bytes(self.sides) - 1, 'little')
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'BitboardStonehengeState':
+        """
+        Return the state that to_bytes (of either kind of state) encoded as
+        data.
+        """
+        return cls.from_int(int.from_bytes(data[1:], 'little'), data[0])
+
+    def __reduce__(self) -> Tuple[Any, Tuple[bytes]]:
+        """
+        Return how to rebuild this state, for pickle and copy: from its
+        to_bytes encoding, so the shared BitboardLayout is not copied with
+        it.
+
+        >>> import copy
+        >>> state = BitboardStonehengeState(False, 3).make_move('E')
+        >>> copy.deepcopy(state).layout is state.layout
+        True
+        """
+        return type(self).from_bytes, (self.to_bytes(),)
+
+    def __eq__(self, other: Any) -> bool:
+        """
+        Return whether this state and other have the same board, cells,
+        leylines and player to move.
+        """
+        return type(other) is type(self) and self.sides == other.sides and \
+            self.pack() == other.pack()
+
+    def __hash__(self) -> int:
+        """
+        Return a hash of this state's board, cells, leylines and player to
+        move.
+        """
+        return hash((self.sides, self.zobrist))
+
+    def __str__(self) -> str:
+        """
+        Return a string representation of the current state of the game.
+        """
+        return str(self.to_hedge_state())
+
+    def get_possible_moves(self) -> list:
+        """
+        Return all possible moves that can be applied to this state.
+
+        >>> state = BitboardStonehengeState(True, 2).make_move('D')
+        >>> state.get_possible_moves()
+        ['A', 'B', 'C', 'E', 'F', 'G']
+        """
+        if self.over():
+            return []
+        return list(self.iter_moves())
+
+    def iter_moves(self, ordered: bool = False) -> Iterator[str]:
+        """
+        Yield the possible moves of this state one at a time, in sorted order,
+        or most urgent first (by move_priority) if ordered.
+
+        >>> state = BitboardStonehengeState(True, 2).make_move('A')
+        >>> next(state.make_move('D').iter_moves(True))
+        'G'
+        """
+        if self.over():
+            return
+        if ordered:
+            yield from sorted(self.iter_moves(), key=self.move_priority,
+                              reverse=True)
+            return
+        letters = self.layout.letters
+        empty = ~(self.p1_cells | self.p2_cells) & \
+            ((1 << len(letters)) - 1)
+        while empty:
+            low = empty & -empty
+            yield letters[low.bit_length() - 1]
+            empty ^= low
+
+    def is_valid_move(self, move: Any) -> bool:
+        """
+        Return whether move is a valid move for this GameState.
+
+        >>> state = BitboardStonehengeState(True, 2).make_move('D')
+        >>> state.is_valid_move('D'), state.is_valid_move('E')
+        (False, True)
+        """
+        cell = self.layout.index.get(move) if isinstance(move, str) else None
+        return cell is not None and \
+            not (self.p1_cells | self.p2_cells) >> cell & 1 and \
+            not self.over()
+
+    def make_move(self, move: Any) -> 'BitboardStonehengeState':
+        """
+        Return the GameState that results from applying move to this GameState.
+
+        >>> state = BitboardStonehengeState(True, 1).make_move('A')
+        >>> state.p1_cells, state.p1_lines
+        (1, 21)
+        """
+        layout = self.layout
+        new_state = BitboardStonehengeState.__new__(BitboardStonehengeState)
+        new_state.sides = self.sides
+        new_state.layout = layout
+        new_state.p1_turn = self.p1_turn
+        new_state.p1_cells = self.p1_cells
+        new_state.p2_cells = self.p2_cells
+        new_state.p1_lines = self.p1_lines
+        new_state.p2_lines = self.p2_lines
+        new_state.zobrist = self.zobrist
+        new_state._undo_stack = None
+        new_state._play_move(move)
+        return new_state
+
+    def apply_move(self, move: Any) -> None:
+        """
+        Apply move to this state in place, remembering the previous bitboards
+        so that undo_move can restore them.
+
+        >>> state = BitboardStonehengeState(True, 2)
+        >>> state.apply_move('A')
+        >>> state.undo_move()
+        >>> state.p1_cells, state.p1_turn
+        (0, True)
+        """
+        if self._undo_stack is None:
+            self._undo_stack = []
+        self._undo_stack.append((self.p1_cells, self.p2_cells,
+                                 self.p1_lines, self.p2_lines, self.zobrist))
+        self._play_move(move)
+
+    def undo_move(self) -> None:
+        """
+        Take back the last move applied with apply_move.
+        """
+        self.p1_cells, self.p2_cells, self.p1_lines, self.p2_lines, \
+            self.zobrist = self._undo_stack.pop()
+        self.p1_turn = not self.p1_turn
+
+    def _play_move(self, move: Any) -> None:
+        """
+        Claim the cell of move for the current player in place, along with
+        any leylines this completes, update the Zobrist hash and pass the
+        turn. If move is not an unclaimed cell, like StonehengeState, only
+        pass the turn.
+
+        >>> state = BitboardStonehengeState(True, 1).make_move('A')
+        >>> state = state.make_move('A').make_move('Z')
+        >>> state.p1_cells, state.p2_cells, state.p1_turn
+        (1, 0, False)
+        """
+        layout = self.layout
+        cell = layout.index.get(move)
+        if cell is None or (self.p1_cells | self.p2_cells) >> cell & 1:
+            self.zobrist ^= layout.turn_key
+            self.p1_turn = not self.p1_turn
+            return
+        claimed = self.p1_lines | self.p2_lines
+        if self.p1_turn:
+            line_keys = layout.line_keys[0]
+            self.zobrist ^= layout.cell_keys[0][cell] ^ layout.turn_key
+            cells = self.p1_cells = self.p1_cells | 1 << cell
+            for line in layout.cell_lines[cell]:
+                if not claimed >> line & 1 and \
+                        (cells & layout.line_masks[line]).bit_count() >= \
+                        layout.line_needed[line]:
+                    self.p1_lines |= 1 << line
+                    self.zobrist ^= line_keys[line]
+        else:
+            line_keys = layout.line_keys[1]
+            self.zobrist ^= layout.cell_keys[1][cell] ^ layout.turn_key
+            cells = self.p2_cells = self.p2_cells | 1 << cell
+            for line in layout.cell_lines[cell]:
+                if not claimed >> line & 1 and \
+                        (cells & layout.line_masks[line]).bit_count() >= \
+                        layout.line_needed[line]:
+                    self.p2_lines |= 1 << line
+                    self.zobrist ^= line_keys[line]
+        self.p1_turn = not self.p1_turn
+
+    def __repr__(self) -> Any:
+        """
+        Return a representation of this state (which can be used for
+        equality testing).
+
+        >>> BitboardStonehengeState(True, 1).__repr__()
+        "P1's Turn: True - P1's Leylines 0 - P2's Leylines 0 - LeyLines Left: 6"
+        >>> state = BitboardStonehengeState(True, 2).make_move('A')
+        >>> state.__repr__() == state.to_hedge_state().__repr__()
+        True
+        """
+        one_occ = self.p1_lines.bit_count()
+        two_occ = self.p2_lines.bit_count()
+        leys_left = len(self.layout.line_masks)
+        return "P1's Turn: {} - P1's Leylines {} - P2's Leylines {} " \
+               "- LeyLines Left: {}"\
+            .format(self.p1_turn, one_occ, two_occ, leys_left)
+
+    def rough_outcome(self) -> float:
+        """
+        Return an estimate in interval [LOSE, WIN] of best outcome the current
+        player can guarantee from state self.
+
+        >>> BitboardStonehengeState(True, 1).rough_outcome()
+        1
+        """
+        if self.over():
+            return self.LOSE
+        children = [self.make_move(move) for move in self.get_possible_moves()]
+        if any(child.over() for child in children):
+            return self.WIN
+        if all(any(child.make_move(move).over()
+                   for move in child.get_possible_moves())
+               for child in children):
+            return self.LOSE
+        return self.DRAW
+
+    def evaluate(self) -> float:
+        """
+        Return a heuristic score strictly between LOSE and WIN for the
+        current player, from how far each player is along every leyline.
+        """
+        layout = self.layout
+        mine, theirs = (self.p1_cells, self.p2_cells) if self.p1_turn \
+            else (self.p2_cells, self.p1_cells)
+        my_lines, their_lines = (self.p1_lines, self.p2_lines) \
+            if self.p1_turn else (self.p2_lines, self.p1_lines)
+        score = float(my_lines.bit_count() - their_lines.bit_count())
+        open_lines = ~(my_lines | their_lines)
+        for line, mask in enumerate(layout.line_masks):
+            if open_lines >> line & 1:
+                score += ((mine & mask).bit_count() -
+                          (theirs & mask).bit_count()) / mask.bit_count()
+        return 0.9 * score / len(layout.line_masks)
+
+    def move_priority(self, move: Any) -> int:
+        """
+        Return how urgent move is for the current player: 3 for every
+        leyline it would claim, 2 for every leyline it stops the other player
+        from claiming next move, and 1 for every other unclaimed leyline
+        the other player is already on.
+        """
+        layout = self.layout
+        claimed = self.p1_lines | self.p2_lines
+        mine, theirs = (self.p1_cells, self.p2_cells) if self.p1_turn \
+            else (self.p2_cells, self.p1_cells)
+        priority = 0
+        for line in layout.cell_lines[layout.index[move]]:
+            if claimed >> line & 1:
+                continue
+            mask = layout.line_masks[line]
+            if (mine & mask).bit_count() + 1 >= layout.line_needed[line]:
+                priority += 3
+            elif (theirs & mask).bit_count() + 1 >= layout.line_needed[line]:
+                priority += 2
+            elif theirs & mask:
+                priority += 1
+        return priority
+
+    def over(self) -> bool:
+        """
+        Return whether or not this game is over at state.
+        """
+        needed = self.layout.win_needed
+        return self.p1_lines.bit_count() >= needed or \
+            self.p2_lines.bit_count() >= needed
+
+    def to_hedge_state(self) -> StonehengeState:
+        """
+        Return the StonehengeState with the same cells, leylines and
+        current player as this state.
+
+        >>> state = BitboardStonehengeState(True, 2).make_move('B')
+        >>> hedge_state = state.to_hedge_state()
+        >>> hedge_state.get_possible_moves(), hedge_state.p1_leylines
+        (['A', 'C', 'D', 'E', 'F', 'G'], 2)
+        """
+        return StonehengeState.from_int(self.to_int(), self.sides)
+
+
+class BitboardStonhengeGame(StonhengeGame):
+    """
+    Stonehenge played on a BitboardStonehengeState.
+    """
+
+    def __init__(self, p1_starts: bool, sides: Optional[int] = None) -> None:
+        """
+        Initialize this Game, using p1_starts to find who the first player is.
+        The number of sides is asked for unless sides is given.
+        """
+        if sides is None:
+            sides = int(input("Enter the number of sides: "))
+        self.current_state = BitboardStonehengeState(p1_starts, sides)
+
+
+if __name__ == "__main__":
+    from python_ta import check_all
+    check_all(config="a2_pyta.txt")
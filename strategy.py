@@ -5,7 +5,129 @@ NOTE: Make sure this file adheres to python-ta.
 Adjust the type annotations as needed, and implement both a recursive
 and an iterative version of minimax.
 """
-from typing import Any
+from typing import Any, Callable, Optional
+import functools
+import math
+import random
+import time
+from search_stats import SearchStats
+from symmetry import distinct_moves
+from transposition import TranspositionTable
+from stonehenge_bitboard import BitboardStonehengeState
+
+# The table shared by transposition_minimax across moves and games.
+MINIMAX_TABLE = TranspositionTable()
+
+# The default number of seconds iterative_deepening may spend on a move.
+TIME_BUDGET = 1.0
+
+
+# The number of plies from the root at which alpha-beta searches skip moves
+# that are symmetric to an earlier move.
+SYMMETRY_DEPTH = 2
+
+# The exploration constant of mcts_strategy's UCT formula.
+EXPLORATION = 1.4
+
+# The tree mcts_strategy built for its last move, kept for the next move,
+# with the number of sides of its board.
+MCTS_TREE = {}
+
+# Statistics about the last search, filled in by the strategies while it is
+# enabled (SEARCH_STATS.enabled = True).
+SEARCH_STATS = SearchStats()
+
+# The process pool of parallel_minimax, started on first use, with its
+# number of workers and the best root score found so far for the current move
+# (shared with every worker).
+PARALLEL_POOL = {}
+
+
+class MCTSNode:
+    """
+    A node of the tree built by mcts_strategy.
+
+    move - the move that led to this node from its parent
+    parent - the parent node, or None for the root
+    p1_moved - whether p1 made move
+    key - the Zobrist hash of the state at this node
+    untried - the moves from this node that have no child yet
+    children - the expanded children of this node
+    visits - the number of playouts through this node
+    wins - the number of those playouts won by the player who made move
+    """
+    move: Any
+    parent: Optional['MCTSNode']
+    p1_moved: bool
+    key: int
+    untried: list
+    children: list
+    visits: int
+    wins: int
+
+    def __init__(self, move: Any, parent: Optional['MCTSNode'], state: Any) \
+            -> None:
+        """
+        Initialize a node reached by move from parent, at state.
+        """
+        self.move = move
+        self.parent = parent
+        self.p1_moved = not state.p1_turn
+        self.key = state.zobrist
+        self.untried = state.get_possible_moves()
+        random.shuffle(self.untried)
+        self.children = []
+        self.visits = 0
+        self.wins = 0
+
+    def best_child(self) -> 'MCTSNode':
+        """
+        Return the child of this node with the highest UCT value.
+        """
+        log_visits = math.log(self.visits)
+        return max(self.children,
+                   key=lambda child: child.wins / child.visits + EXPLORATION *
+                   math.sqrt(log_visits / child.visits))
+
+
+class SearchTimeout(Exception):
+    """
+    Raised inside a search when its time budget has run out.
+    """
+
+
+class SearchCancelled(Exception):
+    """
+    Raised inside a worker's search once another worker has found a win.
+    """
+
+
+def collect_stats(strategy: Callable) -> Callable:
+    """
+    Return strategy, resetting SEARCH_STATS before and timing it after every
+    move it makes while SEARCH_STATS is enabled.
+    """
+    @functools.wraps(strategy)
+    def collecting_strategy(game: Any, *args: Any, **kwargs: Any) -> Any:
+        """
+        Return the move strategy picks for game, collecting SEARCH_STATS.
+        """
+        if not SEARCH_STATS.enabled:
+            return strategy(game, *args, **kwargs)
+        SEARCH_STATS.reset(strategy.__name__)
+        try:
+            return strategy(game, *args, **kwargs)
+        finally:
+            SEARCH_STATS.finish()
+    return collecting_strategy
+
+
+def active_stats() -> Optional[SearchStats]:
+    """
+    Return SEARCH_STATS if it is enabled, and None otherwise. The search
+    helpers are given the result and skip all counting when it is None.
+    """
+    return SEARCH_STATS if SEARCH_STATS.enabled else None
 
 
 def interactive_strategy(game: Any) -> Any:
@@ -57,16 +179,20 @@ def rough_outcome_strategy(game: Any) -> Any:
 # TODO: Implement a recursive version of the minimax strategy.
 
 
+@collect_stats
 def recursive_minimax(game: Any) -> Any:
     """
     Return a move for game through recursive minimax
     """
+    stats = active_stats()
+    if stats is not None:
+        stats.visit(0)
     top_move = game.current_state.get_possible_moves()[0]
     available_moves = game.current_state.get_possible_moves()
     game_score = -1
     for moves in available_moves:
         spare = game.current_state.make_move(moves)
-        player_score = minimum(spare, game)
+        player_score = minimum(spare, game, 1, stats)
         if game.is_over(spare):
             return moves
         elif player_score > game_score:
@@ -75,52 +201,610 @@ def recursive_minimax(game: Any) -> Any:
     return top_move
 
 
-def minimum(gamestate: Any, game: Any) -> Any:
+def minimum(gamestate: Any, game: Any, depth: int = 1,
+            stats: Optional[SearchStats] = None) -> Any:
     """
     Helper function for the mini portion of minimax, current player
     """
     available_moves = gamestate.get_possible_moves()
+    if stats is not None:
+        stats.visit(depth, not available_moves)
     game_score = 1
     for moves in available_moves:
         spare = gamestate.make_move(moves)
-        player_score = maximum(spare, game)
+        player_score = maximum(spare, game, depth + 1, stats)
         if player_score < game_score:
             game_score = player_score
     return game_score
 
 
-def maximum(gamestate: Any, game: Any) -> Any:
+def maximum(gamestate: Any, game: Any, depth: int = 1,
+            stats: Optional[SearchStats] = None) -> Any:
     """
     Helper function for the max portion of minimax, other player
     """
     available_moves = gamestate.get_possible_moves()
+    if stats is not None:
+        stats.visit(depth, not available_moves)
     game_score = -1
     for moves in available_moves:
         spare = gamestate.make_move(moves)
-        player_score = minimum(spare, game)
+        player_score = minimum(spare, game, depth + 1, stats)
+        if player_score > game_score:
+            game_score = player_score
+    return game_score
+
+
+@collect_stats
+def inplace_minimax(game: Any) -> Any:
+    """
+    Return a move for game through recursive minimax, walking the whole tree
+    on game.current_state with apply_move and undo_move instead of building
+    a new state for every node.
+    """
+    stats = active_stats()
+    if stats is not None:
+        stats.visit(0)
+    state = game.current_state
+    available_moves = state.get_possible_moves()
+    top_move = available_moves[0]
+    game_score = -1
+    for moves in available_moves:
+        state.apply_move(moves)
+        if state.over():
+            state.undo_move()
+            return moves
+        player_score = -inplace_score(state, 1, stats)
+        state.undo_move()
+        if player_score > game_score:
+            top_move = moves
+            game_score = player_score
+    return top_move
+
+
+def inplace_score(state: Any, depth: int = 1,
+                  stats: Optional[SearchStats] = None) -> Any:
+    """
+    Helper function for inplace_minimax: return the minimax score of state
+    for the player about to move, leaving state as it was found.
+    """
+    available_moves = state.get_possible_moves()
+    if stats is not None:
+        stats.visit(depth, not available_moves)
+    if not available_moves:
+        return state.LOSE
+    game_score = state.LOSE
+    for moves in available_moves:
+        state.apply_move(moves)
+        player_score = -inplace_score(state, depth + 1, stats)
+        state.undo_move()
         if player_score > game_score:
             game_score = player_score
     return game_score
 
 
+@collect_stats
+def transposition_minimax(game: Any,
+                          table: TranspositionTable = MINIMAX_TABLE) -> Any:
+    """
+    Return a move for game through minimax, remembering the score of every
+    position searched in table so positions reached through different move
+    orders are only searched once.
+    """
+    stats = active_stats()
+    if stats is not None:
+        stats.visit(0)
+    state = game.current_state
+    available_moves = state.get_possible_moves()
+    top_move = available_moves[0]
+    game_score = -1
+    for moves in available_moves:
+        state.apply_move(moves)
+        if state.over():
+            state.undo_move()
+            return moves
+        player_score = -transposition_score(state, table, 1, stats)
+        state.undo_move()
+        if player_score > game_score:
+            top_move = moves
+            game_score = player_score
+    return top_move
+
+
+def transposition_score(state: Any, table: TranspositionTable,
+                        depth: int = 1,
+                        stats: Optional[SearchStats] = None) -> Any:
+    """
+    Helper function for transposition_minimax: return the minimax score of
+    state for the player about to move, looking it up in table first.
+    """
+    game_score = table.lookup(state.zobrist)
+    if stats is not None:
+        stats.cache(game_score is not None)
+    if game_score is not None:
+        return game_score
+    available_moves = state.get_possible_moves()
+    if stats is not None:
+        stats.visit(depth, not available_moves)
+    game_score = state.LOSE
+    for moves in available_moves:
+        state.apply_move(moves)
+        player_score = -transposition_score(state, table, depth + 1, stats)
+        state.undo_move()
+        if player_score > game_score:
+            game_score = player_score
+    table.store(state.zobrist, game_score, len(available_moves))
+    return game_score
+
+
+@collect_stats
+def alphabeta_minimax(game: Any) -> Any:
+    """
+    Return a move for game through minimax with alpha-beta pruning, trying
+    the moves that claim or contest a leyline first.
+    """
+    stats = active_stats()
+    if stats is not None:
+        stats.visit(0)
+    state = game.current_state
+    available_moves = distinct_ordered_moves(state, 0)
+    top_move = available_moves[0]
+    game_score = state.LOSE
+    for moves in available_moves:
+        state.apply_move(moves)
+        if state.over():
+            state.undo_move()
+            return moves
+        player_score = -alphabeta_score(state, -state.WIN, -game_score, 1,
+                                        stats)
+        state.undo_move()
+        if player_score > game_score:
+            top_move = moves
+            game_score = player_score
+            if game_score >= state.WIN:
+                break
+    return top_move
+
+
+def alphabeta_score(state: Any, alpha: Any, beta: Any, depth: int = 1,
+                    stats: Optional[SearchStats] = None) -> Any:
+    """
+    Helper function for alphabeta_minimax: return the minimax score of state
+    for the player about to move, or a bound on it outside of (alpha, beta).
+    """
+    available_moves = distinct_ordered_moves(state, depth)
+    if stats is not None:
+        stats.visit(depth, not available_moves)
+    if not available_moves:
+        return state.LOSE
+    for moves in available_moves:
+        state.apply_move(moves)
+        player_score = -alphabeta_score(state, -beta, -alpha, depth + 1,
+                                        stats)
+        state.undo_move()
+        if player_score > alpha:
+            alpha = player_score
+            if alpha >= beta:
+                break
+    return alpha
+
+
+def ordered_moves(state: Any) -> list:
+    """
+    Return the possible moves of state, most urgent first.
+    """
+    return list(state.iter_moves(ordered=True))
+
+
+def distinct_ordered_moves(state: Any, depth: int) -> list:
+    """
+    Return the possible moves of state, most urgent first, for a search
+    depth plies below the root. Within SYMMETRY_DEPTH plies of the root, a
+    move symmetric to an earlier one is left out: it would lead to an
+    equivalent position, and the earlier move is always the one kept.
+    """
+    available_moves = ordered_moves(state)
+    if depth < SYMMETRY_DEPTH:
+        return distinct_moves(state, available_moves)
+    return available_moves
+
+
+@collect_stats
+def iterative_deepening(game: Any, time_budget: float = TIME_BUDGET,
+                        max_depth: Optional[int] = None) -> Any:
+    """
+    Return a move for game through alpha-beta searches one ply deeper each
+    time, scoring the positions at the depth limit with evaluate().
+
+    Stops when time_budget seconds have passed, or once a search max_depth
+    plies deep has finished, and returns the best move of the deepest search
+    that finished.
+    """
+    deadline = time.perf_counter() + time_budget
+    stats = active_stats()
+    state = game.current_state
+    empty_cells = len(state.get_possible_moves())
+    available_moves = distinct_ordered_moves(state, 0)
+    top_move = available_moves[0]
+    depth = 1
+    while True:
+        try:
+            top_move, game_score = depth_limited_root(state, available_moves,
+                                                      depth, deadline, stats)
+        except SearchTimeout:
+            return top_move
+        if stats is not None:
+            stats.depth_finished()
+        if abs(game_score) >= state.WIN or depth >= empty_cells or \
+                depth == max_depth:
+            return top_move
+        available_moves.remove(top_move)
+        available_moves.insert(0, top_move)
+        depth += 1
+
+
+def depth_limited_root(state: Any, available_moves: list, depth: int,
+                       deadline: float,
+                       stats: Optional[SearchStats] = None) -> Any:
+    """
+    Helper function for iterative_deepening: return the best of
+    available_moves in state after a search depth plies deep, with its score.
+    """
+    if stats is not None:
+        stats.visit(0)
+    top_move = available_moves[0]
+    game_score = -2
+    for moves in available_moves:
+        state.apply_move(moves)
+        try:
+            if state.over():
+                return moves, state.WIN
+            player_score = -depth_limited_score(state, depth - 1, -state.WIN,
+                                                -max(game_score, -1),
+                                                deadline, 1, stats)
+        finally:
+            state.undo_move()
+        if player_score > game_score:
+            top_move = moves
+            game_score = player_score
+            if game_score >= state.WIN:
+                break
+    return top_move, game_score
+
+
+def depth_limited_score(state: Any, depth: int, alpha: Any, beta: Any,
+                        deadline: float, ply: int = 1,
+                        stats: Optional[SearchStats] = None) -> Any:
+    """
+    Helper function for iterative_deepening: return the alpha-beta score of
+    state for the player about to move, searching depth plies and raising
+    SearchTimeout once deadline has passed. ply is the depth of state below
+    the root.
+    """
+    if time.perf_counter() > deadline:
+        raise SearchTimeout
+    if stats is not None:
+        stats.visit(ply, state.over())
+    if state.over():
+        return state.LOSE
+    if depth == 0:
+        return state.evaluate()
+    for moves in distinct_ordered_moves(state, ply):
+        state.apply_move(moves)
+        try:
+            player_score = -depth_limited_score(state, depth - 1, -beta,
+                                                -alpha, deadline, ply + 1,
+                                                stats)
+        finally:
+            state.undo_move()
+        if player_score > alpha:
+            alpha = player_score
+            if alpha >= beta:
+                break
+    return alpha
+
+
+@collect_stats
+def parallel_minimax(game: Any, workers: Optional[int] = None) -> Any:
+    """
+    Return a move for game through alpha-beta minimax, searching the subtree
+    of each root move in a separate process.
+
+    States are sent to the workers in their to_bytes encoding. As soon as one
+    worker proves a winning move, the others stop. The positions the workers
+    search are not counted in SEARCH_STATS; only the time is.
+    """
+    # Imported here, like multiprocessing in parallel_pool, so that loading
+    # this module does not pay for process pools until one is used.
+    from concurrent.futures import as_completed, wait
+    state = game.current_state
+    available_moves = distinct_ordered_moves(state, 0)
+    for moves in available_moves:
+        state.apply_move(moves)
+        game_over = state.over()
+        state.undo_move()
+        if game_over:
+            return moves
+    pool, best = parallel_pool(workers)
+    best.value = state.LOSE
+    encoded = state.to_bytes()
+    futures = [pool.submit(parallel_score, encoded, moves)
+               for moves in available_moves]
+    scores = {}
+    for future in as_completed(futures):
+        moves, player_score = future.result()
+        scores[moves] = player_score
+        if player_score is not None and player_score >= state.WIN:
+            break
+    for future in futures:
+        future.cancel()
+    wait(futures)
+    for moves in available_moves:
+        if scores.get(moves) is not None and scores[moves] >= state.WIN:
+            return moves
+    return available_moves[0]
+
+
+def parallel_pool(workers: Optional[int] = None) -> Any:
+    """
+    Helper function for parallel_minimax: return the shared process pool with
+    workers processes (one per core by default) and its shared best score.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    import multiprocessing
+    from multiprocessing.util import Finalize
+    if PARALLEL_POOL.get('workers', -1) != workers:
+        if 'pool' in PARALLEL_POOL:
+            PARALLEL_POOL['pool'].shutdown()
+        else:
+            Finalize(None, shutdown_parallel_pool, exitpriority=20)
+        best = multiprocessing.Value('i', -1, lock=False)
+        PARALLEL_POOL['pool'] = ProcessPoolExecutor(
+            workers, initializer=init_parallel_worker, initargs=(best,))
+        PARALLEL_POOL['best'] = best
+        PARALLEL_POOL['workers'] = workers
+    return PARALLEL_POOL['pool'], PARALLEL_POOL['best']
+
+
+def shutdown_parallel_pool() -> None:
+    """
+    Helper function for parallel_minimax: stop the shared process pool, if
+    it was started.
+
+    Run as the process exits, before multiprocessing closes its queues and
+    waits for the child processes, so a process using parallel_minimax inside
+    another pool's worker can still exit.
+    """
+    if 'pool' in PARALLEL_POOL:
+        PARALLEL_POOL.pop('pool').shutdown(cancel_futures=True)
+        PARALLEL_POOL.pop('best')
+        PARALLEL_POOL.pop('workers')
+
+
+def init_parallel_worker(best: Any) -> None:
+    """
+    Helper function for parallel_minimax: remember the shared best score in a
+    newly started worker process.
+    """
+    PARALLEL_POOL['best'] = best
+
+
+def parallel_score(encoded: bytes, moves: Any) -> Any:
+    """
+    Helper function for parallel_minimax, run in a worker: return moves with
+    the minimax score of playing it in the encoded state, or with None if the
+    search was cancelled.
+    """
+    state = BitboardStonehengeState.from_bytes(encoded)
+    state.apply_move(moves)
+    best = PARALLEL_POOL['best']
+    try:
+        player_score = -cancellable_score(state, -state.WIN, state.WIN, best)
+    except SearchCancelled:
+        return moves, None
+    if player_score >= state.WIN:
+        best.value = state.WIN
+    return moves, player_score
+
+
+def cancellable_score(state: Any, alpha: Any, beta: Any, best: Any) -> Any:
+    """
+    Helper function for parallel_minimax: return the alpha-beta score of
+    state like alphabeta_score, raising SearchCancelled once the shared best
+    root score is a win.
+    """
+    if best.value >= state.WIN:
+        raise SearchCancelled
+    available_moves = ordered_moves(state)
+    if not available_moves:
+        return state.LOSE
+    for moves in available_moves:
+        state.apply_move(moves)
+        player_score = -cancellable_score(state, -beta, -alpha, best)
+        state.undo_move()
+        if player_score > alpha:
+            alpha = player_score
+            if alpha >= beta:
+                break
+    return alpha
+
+
+@collect_stats
+def mcts_strategy(game: Any, iterations: Optional[int] = None,
+                  time_budget: float = TIME_BUDGET) -> Any:
+    """
+    Return a move for game through Monte Carlo tree search with UCT, running
+    iterations playouts, or as many as fit in time_budget seconds.
+
+    Playouts run on a single bitboard state with apply_move and undo_move.
+    The tree is kept between moves: if the current state is a child or
+    grandchild of the last root, that subtree is searched further. Every
+    playout counts in SEARCH_STATS as one terminal position at the depth the
+    tree was left at, and the playouts per second go in
+    SEARCH_STATS.info['playouts_per_second'].
+    """
+    start = time.perf_counter()
+    stats = active_stats()
+    state = BitboardStonehengeState.from_state(game.current_state)
+    root = reused_root(state)
+    reused_visits = root.visits
+    playouts = 0
+    while (playouts < iterations if iterations is not None else
+           time.perf_counter() - start < time_budget):
+        mcts_playout(root, state, stats)
+        playouts += 1
+    MCTS_TREE['root'] = root
+    MCTS_TREE['sides'] = state.sides
+    if stats is not None:
+        seconds = time.perf_counter() - start
+        stats.info.update(playouts=playouts, reused_visits=reused_visits,
+                          playouts_per_second=playouts / seconds
+                          if seconds > 0 else 0.0)
+    if not root.children:
+        return root.untried[0]
+    return max(root.children, key=lambda child: child.visits).move
+
+
+def reused_root(state: Any) -> MCTSNode:
+    """
+    Helper function for mcts_strategy: return the node for state in the tree
+    of the last move, detached from its parent, or a new node. The tree is
+    only searched if it was built on a board of the same size.
+    """
+    old_root = MCTS_TREE.get('root')
+    if old_root is not None and MCTS_TREE.get('sides') == state.sides:
+        for node in [old_root] + old_root.children + \
+                [grandchild for child in old_root.children
+                 for grandchild in child.children]:
+            if node.key == state.zobrist:
+                node.parent = None
+                return node
+    return MCTSNode(None, None, state)
+
+
+def mcts_playout(root: MCTSNode, state: Any,
+                 stats: Optional[SearchStats] = None) -> None:
+    """
+    Helper function for mcts_strategy: select and expand a node under root,
+    play the game out at random from it, and record the result along the
+    path. state is the state at root and is left as it was found.
+    """
+    node = root
+    depth = 0
+    while not node.untried and node.children:
+        node = node.best_child()
+        state.apply_move(node.move)
+        depth += 1
+    if node.untried:
+        moves = node.untried.pop()
+        state.apply_move(moves)
+        depth += 1
+        child = MCTSNode(moves, node, state)
+        node.children.append(child)
+        node = child
+    if stats is not None:
+        stats.visit(depth, True)
+    available_moves = state.get_possible_moves()
+    while available_moves:
+        state.apply_move(random.choice(available_moves))
+        depth += 1
+        available_moves = state.get_possible_moves()
+    p1_won = not state.p1_turn
+    for _ in range(depth):
+        state.undo_move()
+    while node is not None:
+        node.visits += 1
+        if node.p1_moved == p1_won:
+            node.wins += 1
+        node = node.parent
+
+
+@collect_stats
 def iterative_minimax(game: Any) -> Any:
     """
     Return a move for game through iterative minimax
     """
-    top_move = game.current_state.get_possible_moves()[0]
-    available_moves = game.current_state.get_possible_moves()
+    stats = active_stats()
+    if stats is not None:
+        stats.visit(0)
+    state = BitboardStonehengeState.from_state(game.current_state)
+    available_moves = state.get_possible_moves()
+    top_move = available_moves[0]
     game_score = -1
     for moves in available_moves:
-        spare = game.current_state.make_move(moves)
-        player_score = minimum(spare, game)
-        if game.is_over(spare):
+        state.apply_move(moves)
+        if state.over():
+            state.undo_move()
             return moves
-        elif player_score > game_score:
+        player_score = -iterative_score(state, stats)
+        state.undo_move()
+        if player_score > game_score:
             top_move = moves
             game_score = player_score
     return top_move
 
 
+def iterative_score(state: Any, stats: Optional[SearchStats] = None) -> Any:
+    """
+    Helper function for iterative_minimax: return the minimax score of the
+    BitboardStonehengeState state for the player about to move, walking the
+    tree with an explicit stack.
+
+    Each depth of the stack is a slot in preallocated lists: the cells and
+    leylines of the player to move and of the other player, the bitmask of
+    the moves left to try and the best score found so far. Moves are played
+    on these plain ints inside the loop, so no method is called per
+    position; state itself is not changed.
+    """
+    layout = state.layout
+    line_masks, line_needed = layout.line_masks, layout.line_needed
+    cell_lines, win_needed = layout.cell_lines, layout.win_needed
+    full = (1 << len(layout.letters)) - 1
+    lose = state.LOSE
+    if state.p1_turn:
+        position = (state.p1_cells, state.p2_cells, state.p1_lines,
+                    state.p2_lines)
+    else:
+        position = (state.p2_cells, state.p1_cells, state.p2_lines,
+                    state.p1_lines)
+    untried = 0 if state.over() else ~(position[0] | position[1]) & full
+    if stats is not None:
+        stats.visit(1, not untried)
+    height = untried.bit_count() + 1
+    position_at = [position] * height
+    untried_at = [untried] * height
+    score_at = [lose] * height
+    depth = 0
+    while True:
+        untried = untried_at[depth]
+        if untried:
+            move = untried & -untried
+            untried_at[depth] = untried ^ move
+            mine, theirs, my_lines, their_lines = position_at[depth]
+            mine |= move
+            claimed = my_lines | their_lines
+            for line in cell_lines[move.bit_length() - 1]:
+                if not claimed >> line & 1 and \
+                        (mine & line_masks[line]).bit_count() >= \
+                        line_needed[line]:
+                    my_lines |= 1 << line
+            depth += 1
+            position_at[depth] = (theirs, mine, their_lines, my_lines)
+            untried = untried_at[depth] = \
+                0 if my_lines.bit_count() >= win_needed else \
+                ~(mine | theirs) & full
+            if stats is not None:
+                stats.visit(depth + 1, not untried)
+            score_at[depth] = lose
+        elif depth == 0:
+            return score_at[0]
+        else:
+            player_score = -score_at[depth]
+            depth -= 1
+            if player_score > score_at[depth]:
+                score_at[depth] = player_score
+
+
 if __name__ == "__main__":
     from python_ta import check_all
 
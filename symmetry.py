@@ -0,0 +1,219 @@
+"""
+The symmetries of a Stonehenge board.
+
+The cells of a board lie on a triangular grid, where the three leyline
+directions are the three axes of the grid. A reflection or rotation of the
+grid that maps the board onto itself maps leylines onto leylines, so it maps
+every position onto an equivalent one: same moves, same outcome.
+
+The symmetries of each board size are worked out once, as permutations of
+the bitboard cells and leylines of BitboardStonehengeState.
+"""
+from typing import Any, Dict, List, Tuple
+from itertools import permutations
+from stonehenge import board_layout
+from stonehenge_bitboard import BitboardStonehengeState, get_layout
+
+
+class Symmetries:
+    """
+    The symmetry group of a board with a given number of sides.
+
+    sides - the number of sides of the board
+    cell_perms - for every symmetry, the cell each cell is mapped to
+    line_perms - for every symmetry, the leyline each leyline is mapped to
+    inverses - for every symmetry, the index of its inverse
+    """
+    sides: int
+    cell_perms: List[List[int]]
+    line_perms: List[List[int]]
+    inverses: List[int]
+
+    def __init__(self, sides: int) -> None:
+        """
+        Find the symmetries of the board with sides sides.
+
+        A cell in row r and column c has grid coordinates (r, -c, c - r),
+        which sum to 0 and are each constant along one leyline direction.
+        Each of the 12 ways to permute the coordinates and flip their signs
+        is a symmetry of the grid; it is one of the board if some shift maps
+        the moved cells back onto the board. The first symmetry is always
+        the identity.
+
+        >>> [len(Symmetries(sides).cell_perms) for sides in range(1, 6)]
+        [6, 12, 6, 6, 6]
+        """
+        self.sides = sides
+        layout = get_layout(sides)
+        leylines = board_layout(sides).leylines
+        coordinates = [(0, 0, 0)] * len(layout.letters)
+        for row, letters in enumerate(leylines['-']):
+            for letter in letters:
+                coordinates[layout.index[letter]] = (row, 0, -row)
+        for column, letters in enumerate(leylines['/']):
+            for letter in letters:
+                row = coordinates[layout.index[letter]][0]
+                coordinates[layout.index[letter]] = \
+                    (row, -column, column - row)
+        cell_at = {point: cell for cell, point in enumerate(coordinates)}
+        line_at = {mask: line for line, mask in enumerate(layout.line_masks)}
+        lows = [min(point[axis] for point in coordinates) for axis in range(3)]
+        self.cell_perms = []
+        self.line_perms = []
+        for axes in permutations(range(3)):
+            for sign in (1, -1):
+                moved = [tuple(sign * point[axis] for axis in axes)
+                         for point in coordinates]
+                shift = [lows[axis] - min(point[axis] for point in moved)
+                         for axis in range(3)]
+                cells = [cell_at.get(tuple(point[axis] + shift[axis]
+                                           for axis in range(3)))
+                         for point in moved]
+                if None in cells:
+                    continue
+                lines = [line_at.get(permute(mask, cells))
+                         for mask in layout.line_masks]
+                if None in lines or cells in self.cell_perms:
+                    continue
+                self.cell_perms.append(cells)
+                self.line_perms.append(lines)
+        self.inverses = [self.cell_perms.index(invert(cells))
+                         for cells in self.cell_perms]
+
+
+def permute(mask: int, perm: List[int]) -> int:
+    """
+    Return the bitmask mask with every bit i moved to bit perm[i].
+
+    >>> permute(0b011, [2, 0, 1])
+    5
+    """
+    moved = 0
+    i = 0
+    while mask:
+        if mask & 1:
+            moved |= 1 << perm[i]
+        mask >>= 1
+        i += 1
+    return moved
+
+
+def invert(perm: List[int]) -> List[int]:
+    """
+    Return the permutation that undoes perm.
+
+    >>> invert([2, 0, 1])
+    [1, 2, 0]
+    """
+    inverse = [0] * len(perm)
+    for i, image in enumerate(perm):
+        inverse[image] = i
+    return inverse
+
+
+_SYMMETRIES: Dict[int, Symmetries] = {}
+
+
+def get_symmetries(sides: int) -> Symmetries:
+    """
+    Return the shared Symmetries of a board with sides sides.
+    """
+    if sides not in _SYMMETRIES:
+        _SYMMETRIES[sides] = Symmetries(sides)
+    return _SYMMETRIES[sides]
+
+
+def transformed(state: Any, symmetry: int) -> Tuple[int, int, int, int]:
+    """
+    Return the p1 cells, p2 cells, p1 leylines and p2 leylines of the
+    BitboardStonehengeState state moved by the given symmetry.
+    """
+    symmetries = get_symmetries(state.sides)
+    cells = symmetries.cell_perms[symmetry]
+    lines = symmetries.line_perms[symmetry]
+    return (permute(state.p1_cells, cells), permute(state.p2_cells, cells),
+            permute(state.p1_lines, lines), permute(state.p2_lines, lines))
+
+
+def canonical_transform(state: Any) -> Tuple[Tuple[int, int, int, int], int]:
+    """
+    Return the representative of state under the symmetries of its board,
+    as its p1 cells, p2 cells, p1 leylines and p2 leylines, and the index of
+    the symmetry that moves state onto it.
+
+    The representative is the smallest of the moved positions, so all
+    equivalent positions share it.
+    """
+    state = BitboardStonehengeState.from_state(state)
+    best, best_symmetry = transformed(state, 0), 0
+    for symmetry in range(1, len(get_symmetries(state.sides).cell_perms)):
+        moved = transformed(state, symmetry)
+        if moved < best:
+            best, best_symmetry = moved, symmetry
+    return best, best_symmetry
+
+
+def canonical_key(state: Any) -> Tuple[bool, int, int, int, int]:
+    """
+    Return a key for state shared by exactly the positions equivalent to it.
+
+    >>> from stonehenge import StonehengeState
+    >>> canonical_key(StonehengeState(True, 3).make_move('A')) == \\
+    ...     canonical_key(StonehengeState(True, 3).make_move('B'))
+    True
+    >>> canonical_key(StonehengeState(True, 3).make_move('A')) == \\
+    ...     canonical_key(StonehengeState(True, 3).make_move('D'))
+    False
+    """
+    return (state.p1_turn,) + canonical_transform(state)[0]
+
+
+def canonicalize(state: Any) -> Any:
+    """
+    Return the representative of state under the symmetries of its board, as
+    a state of the same class as state.
+
+    >>> from stonehenge import StonehengeState
+    >>> state = canonicalize(StonehengeState(True, 2).make_move('G'))
+    >>> state.get_possible_moves()
+    ['B', 'C', 'D', 'E', 'F', 'G']
+    """
+    (p1_cells, p2_cells, p1_lines, p2_lines), _ = canonical_transform(state)
+    representative = BitboardStonehengeState.unpack(
+        (state.sides, state.p1_turn, p1_cells, p2_cells, p1_lines, p2_lines))
+    if isinstance(state, BitboardStonehengeState):
+        return representative
+    return representative.to_hedge_state()
+
+
+def distinct_moves(state: Any, moves: List[Any]) -> List[Any]:
+    """
+    Return the moves in moves, in order, leaving out every move that some
+    symmetry keeping state as it is maps an earlier move onto. The moves left
+    out lead to positions equivalent to ones the moves kept lead to.
+
+    >>> from stonehenge import StonehengeState
+    >>> distinct_moves(StonehengeState(True, 2), list('ABCDEFG'))
+    ['A', 'D']
+    """
+    state = BitboardStonehengeState.from_state(state)
+    symmetries = get_symmetries(state.sides)
+    position = transformed(state, 0)
+    keeping = [cells for symmetry, cells in enumerate(symmetries.cell_perms)
+               if symmetry > 0 and transformed(state, symmetry) == position]
+    if not keeping:
+        return moves
+    index, letters = state.layout.index, state.layout.letters
+    seen = set()
+    kept = []
+    for move in moves:
+        if move in seen:
+            continue
+        kept.append(move)
+        seen.update(letters[cells[index[move]]] for cells in keeping)
+    return kept
+
+
+if __name__ == "__main__":
+    from python_ta import check_all
+    check_all(config="a2_pyta.txt")
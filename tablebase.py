@@ -0,0 +1,291 @@
+"""
+Solved endgame tables for small Stonehenge boards.
+
+A table holds the value (WIN or LOSE for the player to move) and a best move
+of every position of a board, worked out once by retrograde analysis and
+stored in a file that is memory-mapped for play. The files are generated
+offline by running this module; without one, tablebase_strategy searches.
+
+Positions are always stored from the point of view of the player to move
+("me" and "other"), so p1 to move and p2 to move share entries. A position is
+indexed by its cells read as a base-3 number (0 empty, 1 me, 2 other), plus
+one bit for every even leyline both players hold exactly half of, saying
+which of them got there first.
+
+File layout: a header, then one uint32 offset per base-3 cell number
+(NO_ENTRY if no position has those cells), then one byte per position: the
+value in the low two bits and the cell index of the best move above them.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+from array import array
+from itertools import combinations
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from stonehenge_bitboard import BitboardStonehengeState, get_layout
+
+
+# The largest board a table can be generated for.
+MAX_SIDES = 3
+
+# The directory the table files are kept in.
+TABLEBASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             'tablebases')
+
+MAGIC = b'STTB'
+HEADER = struct.Struct('<4sBBII')
+NO_ENTRY = 0xFFFFFFFF
+UNKNOWN, WIN, LOSE = 0, 1, 2
+NO_MOVE = 63
+
+# The open tables, by number of sides.
+_TABLES: Dict[int, 'Tablebase'] = {}
+
+
+def tablebase_path(sides: int) -> str:
+    """
+    Return the path of the table file for a board with sides sides.
+    """
+    return os.path.join(TABLEBASE_DIR, 'stonehenge{}.tb'.format(sides))
+
+
+def tie_lines(sides: int) -> List[int]:
+    """
+    Return the leylines of the board with sides sides that both players can
+    hold half of, in index order.
+    """
+    layout = get_layout(sides)
+    return [line for line, mask in enumerate(layout.line_masks)
+            if mask.bit_count() % 2 == 0]
+
+
+def cell_number(layout: Any, mine: int, theirs: int) -> int:
+    """
+    Return the cells of a position as a base-3 number: digit i is 0 if cell
+    i is empty, 1 if it is mine and 2 if it is theirs.
+    """
+    number = 0
+    weight = 1
+    for cell in range(len(layout.letters)):
+        if mine >> cell & 1:
+            number += weight
+        elif theirs >> cell & 1:
+            number += 2 * weight
+        weight *= 3
+    return number
+
+
+def generate(sides: int, path: Optional[str] = None) -> str:
+    """
+    Solve every position of the board with sides sides, write the table to
+    path (tablebase_path(sides) by default) and return the path. The file
+    at path is replaced whole, never written in place.
+
+    Positions are solved from full boards back to the empty one, so the
+    children of a position are always solved before it.
+    """
+    if not 1 <= sides <= MAX_SIDES:
+        raise ValueError("tables can only be generated for sides 1 to {}"
+                         .format(MAX_SIDES))
+    path = path or tablebase_path(sides)
+    layout = get_layout(sides)
+    n_cells = len(layout.letters)
+    ties = tie_lines(sides)
+    offsets = array('I', [NO_ENTRY]) * (3 ** n_cells)
+    entries = bytearray()
+    for filled in range(n_cells, -1, -1):
+        # The player to move has never made more moves than the other.
+        n_mine = filled // 2
+        for mine_cells in combinations(range(n_cells), n_mine):
+            rest = [cell for cell in range(n_cells) if cell not in mine_cells]
+            for their_cells in combinations(rest, filled - n_mine):
+                _solve_cells(layout, sum(1 << c for c in mine_cells),
+                             sum(1 << c for c in their_cells), ties,
+                             offsets, entries)
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    # Write to a new file and move it into place, so a process that already
+    # mapped a table at path keeps reading a complete file.
+    handle, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(handle, 'wb') as table_file:
+            table_file.write(HEADER.pack(MAGIC, 1, sides, n_cells,
+                                         len(entries)))
+            table_file.write(offsets.tobytes())
+            table_file.write(entries)
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    return path
+
+
+def _solve_cells(layout: Any, mine: int, theirs: int, ties: List[int],
+                 offsets: Any, entries: bytearray) -> None:
+    """
+    Solve every position with cells mine and theirs (one per way of
+    settling its tied leylines) and append them to entries.
+    """
+    my_lines = their_lines = 0
+    tied = []
+    for line, mask in enumerate(layout.line_masks):
+        mine_on = (mine & mask).bit_count() >= layout.line_needed[line]
+        theirs_on = (theirs & mask).bit_count() >= layout.line_needed[line]
+        if mine_on and theirs_on:
+            tied.append(line)
+        elif mine_on:
+            my_lines |= 1 << line
+        elif theirs_on:
+            their_lines |= 1 << line
+    offsets[cell_number(layout, mine, theirs)] = len(entries)
+    empty = ~(mine | theirs) & ((1 << len(layout.letters)) - 1)
+    for rank in range(1 << len(tied)):
+        mine_lines, other_lines = my_lines, their_lines
+        for bit, line in enumerate(tied):
+            if rank >> bit & 1:
+                mine_lines |= 1 << line
+            else:
+                other_lines |= 1 << line
+        entries.append(_solve(layout, mine, theirs, mine_lines, other_lines,
+                              empty, ties, offsets, entries))
+
+
+def _solve(layout: Any, mine: int, theirs: int, my_lines: int,
+           their_lines: int, empty: int, ties: List[int], offsets: Any,
+           entries: bytearray) -> int:
+    """
+    Return the table byte of one position, from the already solved bytes of
+    its children.
+    """
+    if their_lines.bit_count() >= layout.win_needed:
+        return LOSE | NO_MOVE << 2
+    if my_lines.bit_count() >= layout.win_needed or not empty:
+        return UNKNOWN | NO_MOVE << 2
+    claimed = my_lines | their_lines
+    first_move = NO_MOVE
+    for cell in range(len(layout.letters)):
+        if not empty >> cell & 1:
+            continue
+        first_move = min(first_move, cell)
+        new_mine = mine | 1 << cell
+        new_lines = my_lines
+        for line in layout.cell_lines[cell]:
+            if not claimed >> line & 1 and \
+                    (new_mine & layout.line_masks[line]).bit_count() >= \
+                    layout.line_needed[line]:
+                new_lines |= 1 << line
+        if new_lines.bit_count() >= layout.win_needed:
+            return WIN | cell << 2
+        child = _read(layout, theirs, new_mine, their_lines, ties, offsets,
+                      entries)
+        if child & 3 == LOSE:
+            return WIN | cell << 2
+    return LOSE | first_move << 2
+
+
+def _read(layout: Any, mine: int, theirs: int, my_lines: int,
+          ties: List[int], offsets: Any, table: Any) -> int:
+    """
+    Return the table byte of the position where the player to move has cells
+    mine and leylines my_lines, and the other player has cells theirs.
+    """
+    rank = 0
+    bit = 1
+    for line in ties:
+        mask = layout.line_masks[line]
+        if (mine & mask).bit_count() * 2 == mask.bit_count() == \
+                (theirs & mask).bit_count() * 2:
+            if my_lines >> line & 1:
+                rank |= bit
+            bit <<= 1
+    offset = offsets[cell_number(layout, mine, theirs)]
+    if offset == NO_ENTRY:
+        return UNKNOWN | NO_MOVE << 2
+    return table[offset + rank]
+
+
+class Tablebase:
+    """
+    A memory-mapped table of solved positions for one board size.
+
+    sides - the number of sides of the board
+    """
+    sides: int
+
+    def __init__(self, path: str) -> None:
+        """
+        Open the table file at path.
+        """
+        with open(path, 'rb') as table_file:
+            self._map = mmap.mmap(table_file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        magic, _, self.sides, n_cells, _ = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise ValueError("{} is not a Stonehenge table".format(path))
+        self._layout = get_layout(self.sides)
+        self._ties = tie_lines(self.sides)
+        self._offsets = memoryview(self._map)[
+            HEADER.size:HEADER.size + 4 * 3 ** n_cells].cast('I')
+        self._entries = memoryview(self._map)[
+            HEADER.size + 4 * 3 ** n_cells:]
+
+    def probe(self, state: Any) -> Tuple[int, Optional[str]]:
+        """
+        Return the value of state for the player to move (WIN, LOSE or
+        UNKNOWN) and the best move, or None if there is no move to make.
+
+        >>> path = os.path.join(tempfile.mkdtemp(), 'stonehenge1.tb')
+        >>> table = Tablebase(generate(1, path))
+        >>> table.probe(BitboardStonehengeState(True, 1))
+        (1, 'A')
+        """
+        state = BitboardStonehengeState.from_state(state)
+        if state.p1_turn:
+            mine, theirs, my_lines = \
+                state.p1_cells, state.p2_cells, state.p1_lines
+        else:
+            mine, theirs, my_lines = \
+                state.p2_cells, state.p1_cells, state.p2_lines
+        entry = _read(self._layout, mine, theirs, my_lines, self._ties,
+                      self._offsets, self._entries)
+        move = entry >> 2
+        if move == NO_MOVE:
+            return entry & 3, None
+        return entry & 3, self._layout.letters[move]
+
+
+def open_tablebase(sides: int) -> Optional[Tablebase]:
+    """
+    Return the table for a board with sides sides, or None if its file has
+    not been generated (by running this module).
+    """
+    if sides not in _TABLES:
+        path = tablebase_path(sides)
+        if not os.path.exists(path):
+            return None
+        _TABLES[sides] = Tablebase(path)
+    return _TABLES[sides]
+
+
+def tablebase_strategy(game: Any) -> Any:
+    """
+    Return a move for game by looking the current state up in the table for
+    its board size, searching with alpha-beta minimax if it is not there or
+    the table was not generated.
+    """
+    state = game.current_state
+    table = open_tablebase(state.sides) if state.sides <= MAX_SIDES else None
+    if table is not None:
+        _, move = table.probe(state)
+        if move is not None:
+            return move
+    from strategy import alphabeta_minimax
+    return alphabeta_minimax(game)
+
+
+if __name__ == "__main__":
+    for arg in sys.argv[1:] or [str(s) for s in range(1, MAX_SIDES + 1)]:
+        print(generate(int(arg)))
@@ -0,0 +1,156 @@
+"""
+A headless self-play tournament runner for Stonehenge.
+
+Plays a number of games between two strategies from usable_strategies in
+parallel worker processes, without printing any boards, and streams one JSON
+line per game followed by a summary line.
+
+Every game can also be appended to a game log (see game_record).
+
+Usage: python tournament.py --sides 3 --p1 ab --p2 mc --games 100
+"""
+from typing import Any, Dict, Iterator, List, Optional, TextIO
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import argparse
+import json
+import sys
+import time
+from game_interface import usable_strategies
+from game_record import GameRecord, GameRecordWriter
+from stonehenge import StonhengeGame
+import strategy
+
+
+def play_game(sides: int, p1: str, p2: str, p1_starts: bool) -> Dict[str, Any]:
+    """
+    Play one game of Stonehenge with sides sides between the strategies
+    named p1 and p2, and return its result, with the moves and the seconds
+    each took under 'history' and 'history_seconds'.
+
+    A strategy that returns an invalid move forfeits the game.
+    """
+    strategy.SEARCH_STATS.enabled = True
+    game = StonhengeGame(p1_starts, sides)
+    strategies = {'p1': usable_strategies[p1], 'p2': usable_strategies[p2]}
+    seconds = {'p1': 0.0, 'p2': 0.0}
+    moves = {'p1': 0, 'p2': 0}
+    nodes = {'p1': 0, 'p2': 0}
+    history, history_seconds = [], []
+    winner = None
+    while not game.is_over(game.current_state):
+        player = game.current_state.get_current_player_name()
+        strategy.SEARCH_STATS.reset(None)
+        start = time.perf_counter()
+        move = strategies[player](game)
+        history_seconds.append(time.perf_counter() - start)
+        seconds[player] += history_seconds[-1]
+        moves[player] += 1
+        nodes[player] += strategy.SEARCH_STATS.nodes
+        if not game.current_state.is_valid_move(move):
+            winner = 'p2' if player == 'p1' else 'p1'
+            break
+        history.append(move)
+        game.current_state = game.current_state.make_move(move)
+    if winner is None:
+        winner = 'p1' if game.is_winner('p1') else \
+            'p2' if game.is_winner('p2') else None
+    return {'type': 'game', 'sides': sides, 'p1': p1, 'p2': p2,
+            'p1_starts': p1_starts, 'winner': winner,
+            'moves': moves['p1'] + moves['p2'],
+            'p1_seconds_per_move': seconds['p1'] / max(moves['p1'], 1),
+            'p2_seconds_per_move': seconds['p2'] / max(moves['p2'], 1),
+            'p1_nodes': nodes['p1'], 'p2_nodes': nodes['p2'],
+            'history': history, 'history_seconds': history_seconds}
+
+
+def run_tournament(sides: int, p1: str, p2: str, games: int,
+                   workers: Optional[int] = None,
+                   record_path: Optional[str] = None) \
+        -> Iterator[Dict[str, Any]]:
+    """
+    Play games games between p1 and p2 in workers processes, the starting
+    player alternating, and yield each result as it finishes followed by a
+    summary of all of them. If record_path is given, every game is appended
+    to the game log there as it finishes.
+
+    Strategies that start their own process pools, like 'mp', can play too.
+
+    >>> results = list(run_tournament(2, 'mp', 'ab', 2, workers=1))
+    >>> [result['type'] for result in results]
+    ['game', 'game', 'summary']
+    """
+    for name in (p1, p2):
+        if name not in usable_strategies or name == 'i':
+            raise ValueError("{!r} is not a headless strategy".format(name))
+    results = []
+    writer = GameRecordWriter(record_path) if record_path else None
+    try:
+        with ProcessPoolExecutor(workers) as pool:
+            futures = [pool.submit(play_game, sides, p1, p2, i % 2 == 0)
+                       for i in range(games)]
+            for future in as_completed(futures):
+                result = future.result()
+                history = result.pop('history')
+                history_seconds = result.pop('history_seconds')
+                if writer is not None:
+                    writer.write(GameRecord(sides, result['p1_starts'],
+                                            history,
+                                            seconds=history_seconds))
+                results.append(result)
+                yield result
+    finally:
+        if writer is not None:
+            writer.close()
+    yield summarize(results)
+
+
+def summarize(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Return the win rates, average move latency and nodes searched over the
+    game results.
+    """
+    games = max(len(results), 1)
+    summary = {'type': 'summary', 'games': len(results)}
+    for player in ('p1', 'p2'):
+        summary[player] = results[0][player] if results else None
+        summary[player + '_win_rate'] = \
+            sum(result['winner'] == player for result in results) / games
+        summary[player + '_seconds_per_move'] = \
+            sum(result[player + '_seconds_per_move']
+                for result in results) / games
+        summary[player + '_nodes'] = \
+            sum(result[player + '_nodes'] for result in results)
+    return summary
+
+
+def main(argv: Optional[List[str]] = None, output: TextIO = sys.stdout) \
+        -> None:
+    """
+    Run a tournament from the command line arguments argv, writing JSON lines
+    to output.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sides', type=int, required=True)
+    parser.add_argument('--p1', required=True)
+    parser.add_argument('--p2', required=True)
+    parser.add_argument('--games', type=int, default=10)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--output', default=None,
+                        help="file to append the JSON lines to")
+    parser.add_argument('--record', default=None,
+                        help="game log to append every game to")
+    args = parser.parse_args(argv)
+    if args.output is not None:
+        output = open(args.output, 'a')
+    try:
+        for result in run_tournament(args.sides, args.p1, args.p2,
+                                     args.games, args.workers, args.record):
+            output.write(json.dumps(result) + '\n')
+            output.flush()
+    finally:
+        if args.output is not None:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
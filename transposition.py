@@ -0,0 +1,132 @@
+"""
+A bounded transposition table for game tree searches.
+
+Entries are keyed by a state's Zobrist hash, so positions reached through
+different move orders share one search result.
+"""
+from typing import Any, Optional
+from collections import OrderedDict
+
+
+# A rough size in bytes of one stored entry (key, value, depth and the
+# container overhead), used to turn a memory cap into a number of entries.
+ENTRY_BYTES = 200
+
+
+class TranspositionTable:
+    """
+    A table of search results with a fixed maximum number of entries.
+
+    capacity - the maximum number of entries kept
+    policy - 'depth' to keep the entry with the larger searched depth when
+             two keys compete for a slot, or 'lru' to evict the least
+             recently used entry
+    hits - the number of lookups that found an entry
+    misses - the number of lookups that did not
+    """
+    capacity: int
+    policy: str
+    hits: int
+    misses: int
+
+    def __init__(self, capacity: int = 1 << 20,
+                 policy: str = 'depth') -> None:
+        """
+        Initialize an empty TranspositionTable holding at most capacity
+        entries and evicting with policy.
+
+        >>> table = TranspositionTable(2, 'lru')
+        >>> table.store(1, 'a', 0)
+        >>> table.store(2, 'b', 0)
+        >>> table.lookup(1)
+        'a'
+        >>> table.store(3, 'c', 0)
+        >>> table.lookup(2) is None, table.hits, table.misses
+        (True, 1, 1)
+        """
+        if capacity < 1:
+            raise ValueError("capacity must be positive")
+        if policy not in ('depth', 'lru'):
+            raise ValueError("policy must be 'depth' or 'lru'")
+        self.capacity = capacity
+        self.policy = policy
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._slots = []
+        self.clear()
+
+    @classmethod
+    def with_memory(cls, megabytes: float,
+                    policy: str = 'depth') -> 'TranspositionTable':
+        """
+        Return an empty TranspositionTable sized to use about megabytes
+        of memory.
+        """
+        return cls(max(1, int(megabytes * (1 << 20) / ENTRY_BYTES)), policy)
+
+    def __len__(self) -> int:
+        """
+        Return the number of entries stored in this table.
+        """
+        if self.policy == 'lru':
+            return len(self._entries)
+        if not self._slots:
+            return 0
+        return self.capacity - self._slots.count(None)
+
+    def clear(self) -> None:
+        """
+        Remove every entry from this table and reset its counters.
+        """
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        # The slots are allocated by the first store, so that tables made at
+        # import time cost nothing until they are used.
+        if self._slots:
+            self._slots = [None] * self.capacity
+        else:
+            self._slots = []
+
+    def lookup(self, key: int) -> Optional[Any]:
+        """
+        Return the value stored for key, or None if there is none.
+        """
+        if self.policy == 'lru':
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value[0]
+        slots = self._slots
+        entry = slots[key % self.capacity] if slots else None
+        if entry is None or entry[0] != key:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[1]
+
+    def store(self, key: int, value: Any, depth: int) -> None:
+        """
+        Store value for key, found by a search of the given depth.
+        """
+        if self.policy == 'lru':
+            self._entries[key] = (value, depth)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+            return
+        if not self._slots:
+            self._slots = [None] * self.capacity
+        slot = key % self.capacity
+        entry = self._slots[slot]
+        if entry is None or entry[0] == key or entry[2] <= depth:
+            self._slots[slot] = (key, value, depth)
+
+
+if __name__ == "__main__":
+    from python_ta import check_all
+    check_all(config="a2_pyta.txt")